@@ -11,14 +11,20 @@ team_composition = {
 TEAMS = 8
 # Last reasonable player to be rostered for each position
 # Divide by 2 to get last reasonable player starting
-def last_pos(pos,teams=TEAMS):
+def last_pos(pos,teams=TEAMS,composition=team_composition):
     last_player = -0.5
     if pos == 'RB' or pos == 'WR' or pos == 'TE':
-        last_player = team_composition[pos]*teams + team_composition['FLEX']*teams*0.5 + team_composition['SFLEX']*teams*0.2
+        last_player = composition[pos]*teams + composition['FLEX']*teams*0.5 + composition['SFLEX']*teams*0.2
     if pos == 'QB':
-        last_player = team_composition[pos]*teams + team_composition['SFLEX']*teams
+        last_player = composition[pos]*teams + composition['SFLEX']*teams
     if pos == 'K':
-        last_player = team_composition[pos]*teams
+        last_player = composition[pos]*teams
     # Account for bench spots
     last_player = last_player*2
     return last_player
+
+# Positions that can fill each flexible starting slot
+flex_positions = {
+    'FLEX': ['RB', 'WR', 'TE'],
+    'SFLEX': ['QB', 'RB', 'WR', 'TE']
+}
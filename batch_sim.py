@@ -0,0 +1,87 @@
+# Score many simulated leagues at once on top of a ScoreTensor
+import numpy as np
+from assumptions import team_composition
+from lineup import best_lineups, lineup_rows, slot_values
+from profiling import profiled
+
+# all-play wins: number of other teams beaten each week, summed over the season
+# weekly is (..., weeks, teams)
+def all_play_wins(weekly):
+    return (weekly[..., :, None] > weekly[..., None, :]).sum(axis=-1).sum(axis=-2)
+
+# Variance of each team's weekly score as the quadratic form 1' S 1 over the season covariance
+# The old pivot only kept weeks in which someone on the roster has a row, so rosters that miss a
+# week entirely are recomputed from their weekly sums over the weeks they cover.
+@profiled()
+def team_variances(tensor, slots, seasons, chunk=4096):
+    slots = np.asarray(slots)
+    seasons = np.broadcast_to(seasons, slots.shape[:1])
+    variances = np.zeros(slots.shape[:2])
+    for season in np.unique(seasons):
+        pool, cov = tensor.covariance(season)
+        matrix = tensor.season(season)
+        appeared = tensor.season_appeared(season)
+        leagues = np.flatnonzero(seasons == season)
+        for start in range(0, len(leagues), chunk):
+            part = leagues[start:start + chunk]
+            idx = pool[slots[part]]
+            variance = cov[idx[..., :, None], idx[..., None, :]].sum(axis=(-1, -2))
+            covered = appeared[:, slots[part]].any(axis=3)
+            partial = ~covered.all(axis=0)
+            if partial.any():
+                scores = matrix[:, slots[part]].sum(axis=3)[:, partial]
+                mask = covered[:, partial]
+                n = mask.sum(axis=0)
+                mean = (scores * mask).sum(axis=0) / n
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    variance[partial] = (mask * (scores - mean) ** 2).sum(axis=0) / (n - 1)
+            variances[part] = variance
+    return variances
+
+# slots is a (leagues, teams, roster size) array of tensor slots
+# seasons is one season for every league or one season per league
+# positions is an optional position code per tensor slot (lineup.slot_positions); with it every team
+# only scores its best legal starting lineup of each week under composition, picked by the
+# actual points or by projections, a value per tensor slot, and the bench scores nothing.
+# Returns weekly scores (leagues, weeks, teams), total points, team variance and all-play wins
+# (leagues, teams).
+# Leagues from shorter seasons are padded with zero weeks, which add no points or wins.
+@profiled()
+def simulate_leagues(tensor, slots, seasons, chunk=4096, positions=None, composition=team_composition, projections=None):
+    slots = np.asarray(slots)
+    n_leagues, n_teams, _ = slots.shape
+    seasons = np.broadcast_to(seasons, (n_leagues,))
+    unique = np.unique(seasons)
+    n_weeks = max(len(tensor.weeks[s]) for s in unique)
+    weekly = np.zeros((n_leagues, n_weeks, n_teams))
+    variance = np.zeros((n_leagues, n_teams))
+    for season in unique:
+        matrix = tensor.season(season)
+        leagues = np.flatnonzero(seasons == season)
+        for start in range(0, len(leagues), chunk):
+            part = leagues[start:start + chunk]
+            # (weeks, leagues, teams, roster) -> (leagues, weeks, teams)
+            if positions is None:
+                scores = matrix[:, slots[part]].sum(axis=3)
+            else:
+                # rosters laid out by position, gathered straight from the tensor
+                rows, ranges = lineup_rows(slots[part], positions[slots[part]], tensor.empty, composition)
+                values = None if projections is None else slot_values(projections, rows, tensor.empty)
+                scores = best_lineups(np.moveaxis(matrix[:, rows], 1, 0), ranges, composition, values)
+                # lineups change week to week, so the variance comes from the weekly scores
+                # over the weeks someone on the roster has a row, as in team_variances
+                mask = tensor.season_appeared(season)[:, slots[part]].any(axis=3)
+                n = mask.sum(axis=0)
+                mean = (scores * mask).sum(axis=0) / n
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    variance[part] = (mask * (scores - mean) ** 2).sum(axis=0) / (n - 1)
+            weekly[part, :len(matrix)] = scores.transpose(1, 0, 2)
+    wins = np.zeros((n_leagues, n_teams), dtype=np.int64)
+    for start in range(0, n_leagues, chunk):
+        wins[start:start + chunk] = all_play_wins(weekly[start:start + chunk])
+    return {
+        'weekly': weekly,
+        'points': weekly.sum(axis=1),
+        'variance': team_variances(tensor, slots, seasons, chunk) if positions is None else variance,
+        'wins': wins
+    }
@@ -0,0 +1,218 @@
+# Offline benchmarks of the hot paths on synthetic league data
+# synthetic_tables generates player_identity/weekly_stats/yearly_stats/overall_stats tables with
+# the same columns as create_base_tables.py for any number of players, seasons and weeks. main
+# times every case at every size, writes the results to JSON and flags cases that got slower than
+# a stored baseline.
+#   python benchmark.py                   run and compare against data/benchmark_baseline.json
+#   python benchmark.py --save-baseline   run and store the results as the new baseline
+#   python benchmark.py --profile         also print the per-stage profiling table at exit
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+import efficient_frontier
+import profiling
+import portfolio_analysis
+import positional_covariance
+from assumptions import TEAMS
+from create_base_tables import build_yearly, build_overall
+from data_store import lean_tables
+from derived import groups
+from replacement import replacement_stats, par
+from score_matrix import ScoreTensor
+
+RESULTS = 'data/benchmark.json'
+BASELINE = 'data/benchmark_baseline.json'
+# back to back runs on one machine differ by up to about 1.35x, so only slowdowns past this are flagged
+THRESHOLD = 1.5
+# slowdowns smaller than this many seconds are timer noise on sub-millisecond cases, never flagged
+MIN_DELTA = 0.005
+# fast cases keep repeating until they have run this many seconds in total, up to MAX_REPEAT times
+MIN_TOTAL = 1.0
+MAX_REPEAT = 1000
+# (players, seasons, weeks)
+SIZES = {
+    'small': (400, 2, 17),
+    'medium': (1500, 6, 17),
+    'large': (4000, 23, 18)
+}
+NFL_TEAMS = 32
+POSITIONS = ['QB', 'RB', 'WR', 'TE', 'K']
+POSITION_SHARE = [0.12, 0.30, 0.38, 0.15, 0.05]
+# mean weekly PPR points by position, a player's own mean is drawn around it
+POSITION_MEAN = {'QB': 15.0, 'RB': 9.0, 'WR': 9.0, 'TE': 6.0, 'K': 7.0}
+
+# Synthetic identity, weekly, yearly and overall tables for seasons ending in 2024
+def synthetic_tables(players=1500, seasons=6, weeks=17, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.array([f'00-{i:07d}' for i in range(players)])
+    positions = rng.choice(POSITIONS, size=players, p=POSITION_SHARE)
+    identity = pd.DataFrame({
+        'player_id': ids,
+        'player_name': [f'P.Player{i}' for i in range(players)],
+        'position': positions
+    })
+    teams = np.array([f'T{i:02d}' for i in range(NFL_TEAMS)])
+    # every player is active in about 70% of the seasons and plays about 85% of the weeks
+    season_list = np.arange(2025 - seasons, 2025)
+    p, s = np.meshgrid(np.arange(players), season_list, indexing='ij')
+    active = rng.random(p.shape) < 0.7
+    p, s = p[active], s[active]
+    team = rng.integers(0, NFL_TEAMS, size=len(p))
+    mean = np.array([POSITION_MEAN[pos] for pos in positions])[p] * rng.gamma(2.0, 0.5, size=len(p))
+    pw = np.repeat(np.arange(len(p)), weeks)
+    week = np.tile(np.arange(1, weeks + 1), len(p))
+    played = rng.random(len(pw)) < 0.85
+    pw, week = pw[played], week[played]
+    n = len(pw)
+    pos = positions[p[pw]]
+    share = rng.gamma(2.0, 0.5, size=n) * mean[pw]
+    passing = np.where(pos == 'QB', share * 12, 0).round()
+    rushing = np.where(pos == 'RB', share * 5, np.where(pos == 'QB', share, share * 0.2)).round()
+    receiving = np.where(np.isin(pos, ['WR', 'TE']), share * 6, np.where(pos == 'RB', share * 1.5, 0)).round()
+    weekly = pd.DataFrame({
+        'player_id': ids[p[pw]],
+        'recent_team': teams[team[pw]],
+        'season': s[pw],
+        'week': week,
+        'opponent_team': teams[rng.integers(0, NFL_TEAMS, size=n)],
+        'passing_yards': passing,
+        'passing_tds': rng.poisson(passing / 150),
+        'interceptions': rng.poisson(passing / 400),
+        'rushing_yards': rushing,
+        'rushing_tds': rng.poisson(rushing / 100),
+        'receptions': rng.poisson(receiving / 11),
+        'receiving_yards': receiving,
+        'receiving_tds': rng.poisson(receiving / 120),
+        'fumbles': rng.poisson(0.05, size=n),
+        '2pt': rng.poisson(0.02, size=n)
+    })
+    weekly.insert(13, 'fantasy_points_ppr', (
+        weekly['passing_yards'] * 0.04 + weekly['passing_tds'] * 4 - weekly['interceptions'] * 2 +
+        weekly['rushing_yards'] * 0.1 + weekly['rushing_tds'] * 6 + weekly['receptions'] +
+        weekly['receiving_yards'] * 0.1 + weekly['receiving_tds'] * 6 - weekly['fumbles'] * 2 +
+        weekly['2pt'] * 2).round(2))
+    yearly = build_yearly(weekly)
+    overall = build_overall(yearly)
+    # same player codes and dtypes as the tables load_table returns
+    return lean_tables(identity, weekly, yearly, overall)
+
+# median of at least repeat wall times, with anything the function prints swallowed
+# The median does not reward one lucky run the way the best time does, so baselines are steadier.
+def timeit(func, repeat=5):
+    times = []
+    while len(times) < repeat or (sum(times) < MIN_TOTAL and len(times) < MAX_REPEAT):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+# name -> callable for every benchmarked hot path on one set of tables
+def cases(identity, weekly, yearly, overall):
+    season = int(weekly['season'].max())
+    players = overall.merge(identity.drop(columns='player_id'), on='player_code', how='left')
+    par_results = par(players, replacement_stats(players))
+    par_results = par_results[par_results['position'].isin(['QB','RB','WR','TE'])]
+    draft_order = efficient_frontier.add_noise(par_results, season).sort_values(by='par_noise', ascending=False).reset_index(drop=True)
+    rosters = efficient_frontier.sim_snake_draft(TEAMS, draft_order, season)
+    tensor = ScoreTensor(weekly)
+    teams = efficient_frontier.sim_season(rosters, weekly, season)
+    top_players = groups(yearly, weekly, identity, overall)
+    maximal = [rosters[0]]
+    benchmarks = {
+        'sim_snake_draft': lambda: efficient_frontier.sim_snake_draft(TEAMS, draft_order, season),
+        'sim_season': lambda: efficient_frontier.sim_season(rosters, weekly, season),
+        'sim_season_tensor': lambda: efficient_frontier.sim_season(rosters, weekly, season, tensor=tensor),
+        'team_variance': lambda: efficient_frontier.team_variance(rosters, weekly, season),
+        'team_variance_tensor': lambda: efficient_frontier.team_variance(rosters, weekly, season, tensor=tensor),
+        'find_wins': lambda: efficient_frontier.find_wins(teams),
+        'replacement_stats': lambda: replacement_stats(players),
+        'slot_correlations': lambda: positional_covariance.slot_correlations(top_players, seasons=range(2002, 2025)),
+        'find_non_maximal_team': lambda: portfolio_analysis.find_non_maximal_team(maximal, par_results, weekly, season, tensor=tensor),
+        'rank_non_maximal_teams': lambda: portfolio_analysis.rank_non_maximal_teams(maximal, par_results, tensor, season)
+    }
+    # pos_variance walks every season from 2002 and needs data for all of them
+    if set(range(2002, 2025)) <= set(weekly['season'].unique()):
+        benchmarks['pos_variance'] = lambda: positional_covariance.pos_variance(top_players, ('QB1','WR1'))
+    return benchmarks
+
+def run(sizes=SIZES, repeat=5, only=None):
+    # every repeat does the full work instead of reading the on-disk cache
+    os.environ['FF_NO_CACHE'] = '1'
+    results = []
+    for size, (players, seasons, weeks) in sizes.items():
+        tables = synthetic_tables(players, seasons, weeks)
+        for case, func in cases(*tables).items():
+            if only and case not in only:
+                continue
+            seconds = timeit(func, repeat)
+            results.append({'case': case, 'size': size, 'players': players, 'seasons': seasons,
+                            'weeks': weeks, 'rows': len(tables[1]), 'seconds': seconds})
+            print(f'{size:>8} {case:<24} {seconds:10.4f}s')
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__
+        },
+        'results': results
+    }
+
+# cases that take more than threshold times their baseline time and at least min_delta seconds more
+def regressions(current, baseline, threshold=THRESHOLD, min_delta=MIN_DELTA):
+    before = {(r['case'], r['size']): r['seconds'] for r in baseline['results']}
+    flagged = []
+    for r in current['results']:
+        old = before.get((r['case'], r['size']))
+        if old is not None and r['seconds'] > old * threshold and r['seconds'] - old >= min_delta:
+            flagged.append({**r, 'baseline': old, 'ratio': r['seconds'] / old})
+    return flagged
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis hot paths on synthetic data')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--cases', nargs='+', default=None)
+    parser.add_argument('--repeat', type=int, default=5, help='fewest timed runs per case, fast cases run more')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--min-delta', type=float, default=MIN_DELTA, help='seconds of slowdown below which a case is never flagged')
+    parser.add_argument('--output', default=RESULTS)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--profile', action='store_true', help='record per-stage time and memory, which slows the cases down')
+    args = parser.parse_args()
+    if args.profile:
+        if args.save_baseline:
+            parser.error('a profiled run is slower and cannot be saved as the baseline')
+        profiling.enable()
+    current = run({s: SIZES[s] for s in args.sizes}, args.repeat, args.cases)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        return
+    if args.profile:
+        # profiled timings are not comparable to the baseline
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f'No baseline at {args.baseline}, run with --save-baseline to record one')
+        return
+    flagged = regressions(current, baseline, args.threshold, args.min_delta)
+    for r in flagged:
+        print(f"REGRESSION {r['size']} {r['case']}: {r['seconds']:.4f}s vs {r['baseline']:.4f}s ({r['ratio']:.2f}x)")
+    if flagged:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# On-disk memoization of derived tables
+# A cached result is keyed by the hashes of the store files of the source tables it is built
+# from, which build_store keeps in step with the csv files, the player code registry of the store,
+# the league settings in assumptions.py, the function name and version and the call arguments, so
+# it is invalidated as soon as any of them change. The cache directory is kept under MAX_BYTES by
+# evicting the least recently used entries. Set FF_NO_CACHE=1 to bypass it.
+import functools
+import glob
+import hashlib
+import json
+import os
+import pickle
+import assumptions
+from data_store import CODES_PATH, TABLES, build_store, table_dir
+
+CACHE_DIR = os.path.join('data', 'cache')
+MAX_BYTES = 1024**3
+
+# sha256 of a file, remembered per (path, size, mtime) for the life of the process
+_file_hashes = {}
+
+def file_hash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+# league settings read at call time, so edits made at runtime count too
+def assumptions_fingerprint():
+    settings = {
+        'TEAMS': assumptions.TEAMS,
+        'team_composition': assumptions.team_composition,
+        'flex_positions': assumptions.flex_positions
+    }
+    return json.dumps(settings, sort_keys=True)
+
+# hash of the store files of a table, None when the table is in neither the store nor a csv
+def table_hash(table):
+    paths = sorted(glob.glob(os.path.join(table_dir(table), '*')))
+    if not paths:
+        return None
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(f'{os.path.basename(path)}:{file_hash(path)}'.encode())
+    return digest.hexdigest()
+
+# results hold player codes, so the registry is brought up to date and hashed along with the tables
+# None when a source table is missing, which makes the call a cache miss
+def cache_key(name, version, sources, args, kwargs):
+    build_store(tables=sources)
+    digest = hashlib.sha256()
+    digest.update(f'{name}:{version}'.encode())
+    for table in sources:
+        source = table_hash(table)
+        if source is None:
+            return None
+        digest.update(source.encode())
+    if os.path.exists(CODES_PATH):
+        digest.update(file_hash(CODES_PATH).encode())
+    digest.update(assumptions_fingerprint().encode())
+    digest.update(pickle.dumps((args, sorted(kwargs.items()))))
+    return digest.hexdigest()[:32]
+
+# drop least recently used entries until the cache fits in max_bytes
+def evict(max_bytes=MAX_BYTES):
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = [os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR) if f.endswith('.pkl')]
+    entries = sorted(entries, key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in entries)
+    for path in entries:
+        if total <= max_bytes:
+            break
+        total -= os.path.getsize(path)
+        os.remove(path)
+
+# The cached result of name under key, computed and stored on a miss
+# For results that are not built from store tables, where the caller hashes its own inputs.
+def cached(name, key, compute):
+    if os.environ.get('FF_NO_CACHE'):
+        return compute()
+    path = os.path.join(CACHE_DIR, f'{name}-{key}.pkl')
+    if os.path.exists(path):
+        # touching the entry marks it as recently used
+        os.utime(path)
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    result = compute()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+    evict()
+    return result
+
+# sources are the TABLES the function reads; bump version whenever its logic changes
+def memoize(version=1, sources=tuple(TABLES)):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if os.environ.get('FF_NO_CACHE'):
+                return func(*args, **kwargs)
+            key = cache_key(func.__qualname__, version, sources, args, kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+            return cached(func.__name__, key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+def clear():
+    evict(max_bytes=0)
@@ -1,83 +1,234 @@
-import nfl_data_py as nfl
+# Build the identity, weekly, yearly and overall tables from nflverse weekly data
+# Raw weekly data is cached per season under data/raw, so a refresh only downloads the seasons
+# that are missing or stale, several at a time, and only re-aggregates the weekly, yearly and
+# overall rows of those seasons. The download goes through a fetcher, any callable from a season
+# to its raw weekly frame, so file_fetcher can stand in for nfl_data_py offline.
+#   python create_base_tables.py                    fetch missing seasons and seasons still in progress
+#   python create_base_tables.py --refresh 2023     also refetch 2023
+#   python create_base_tables.py --source DIR       read raw seasons from DIR instead of nflverse
+#   python create_base_tables.py --profile          also print the per-stage profiling table at exit
+import argparse
+import datetime
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from data_store import DATA_DIR, csv_path, player_key, save_tables
+from profiling import profiled, stage
 
-raw = nfl.import_weekly_data(
-    years = [x for x in range(1999,2025)],
-    columns = ['player_id', 'player_name', 'position',
-       'position_group', 'recent_team', 'season', 'week',
-       'season_type', 'opponent_team',
-       'passing_yards', 'passing_tds', 'interceptions',
-       'sack_fumbles', 'sack_fumbles_lost',
-       'passing_2pt_conversions', 'rushing_yards',
-       'rushing_tds', 'rushing_fumbles', 'rushing_fumbles_lost',
-       'rushing_2pt_conversions',
-       'receptions', 'receiving_yards', 'receiving_tds',
-       'receiving_fumbles', 'receiving_fumbles_lost',
-       'receiving_2pt_conversions', 'special_teams_tds', 'fantasy_points', 'fantasy_points_ppr']
-)
+SEASONS = range(1999, 2025)
+RAW_DIR = os.path.join(DATA_DIR, 'raw')
+# a season still in progress is refetched once its raw file is older than this many hours
+MAX_AGE = 12
+COLUMNS = ['player_id', 'player_name', 'position',
+   'position_group', 'recent_team', 'season', 'week',
+   'season_type', 'opponent_team',
+   'passing_yards', 'passing_tds', 'interceptions',
+   'sack_fumbles', 'sack_fumbles_lost',
+   'passing_2pt_conversions', 'rushing_yards',
+   'rushing_tds', 'rushing_fumbles', 'rushing_fumbles_lost',
+   'rushing_2pt_conversions',
+   'receptions', 'receiving_yards', 'receiving_tds',
+   'receiving_fumbles', 'receiving_fumbles_lost',
+   'receiving_2pt_conversions', 'special_teams_tds', 'fantasy_points', 'fantasy_points_ppr']
+
+def raw_path(season, raw_dir=RAW_DIR):
+    return os.path.join(raw_dir, f'weekly_{season}.parquet')
+
+# default fetcher, one season of weekly data from nflverse
+def nfl_fetcher(season):
+    import nfl_data_py as nfl
+    return nfl.import_weekly_data(years=[season], columns=COLUMNS)
+
+# fetcher reading weekly_<season>.parquet or .csv files from a directory
+def file_fetcher(directory):
+    def fetch(season):
+        path = raw_path(season, directory)
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+        return pd.read_csv(path.replace('.parquet', '.csv'))
+    return fetch
+
+# a season's weekly data can change until its last game, the Super Bowl in February
+def season_end(season):
+    return datetime.datetime(season + 1, 2, 15).timestamp()
+
+# seasons with a raw file in the cache
+def cached_seasons(raw_dir=RAW_DIR):
+    paths = glob.glob(os.path.join(raw_dir, 'weekly_*.parquet'))
+    return sorted(int(os.path.basename(path)[7:-8]) for path in paths)
+
+# Seasons that need fetching: no raw file yet, listed in refresh, or fetched before the season
+# ended and older than max_age hours. A finished season is fetched once more after it ends and
+# then never again.
+def stale_seasons(seasons, refresh=(), max_age=MAX_AGE, raw_dir=RAW_DIR, now=None):
+    now = time.time() if now is None else now
+    stale = []
+    for season in seasons:
+        path = raw_path(season, raw_dir)
+        if not os.path.exists(path) or season in refresh:
+            stale.append(season)
+            continue
+        fetched = os.path.getmtime(path)
+        if fetched < season_end(season) and now - fetched > max_age * 3600:
+            stale.append(season)
+    return stale
+
+# fetch seasons concurrently into the raw cache, each file is replaced atomically
+@profiled('create_base_tables.fetch')
+def fetch_seasons(seasons, fetcher=nfl_fetcher, workers=8, raw_dir=RAW_DIR):
+    os.makedirs(raw_dir, exist_ok=True)
+    def fetch(season):
+        raw = fetcher(season)
+        path = raw_path(season, raw_dir)
+        raw.to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        return season
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(fetch, seasons))
+
+def load_raw(seasons, raw_dir=RAW_DIR, columns=None):
+    return pd.concat([pd.read_parquet(raw_path(s, raw_dir), columns=columns) for s in seasons], ignore_index=True)
 
 # First drop irrelevant rows
-# Remove all playoff data
-raw = raw[raw['season_type'] == 'REG']
-# Remove defensive players and offensive linemen
-raw = raw[raw['position'].isin(['RB', 'QB', 'WR', 'TE', 'FB', 'K', 'HB'])]
+def filter_raw(raw):
+    # Remove all playoff data
+    raw = raw[raw['season_type'] == 'REG']
+    # Remove defensive players and offensive linemen
+    raw = raw[raw['position'].isin(['RB', 'QB', 'WR', 'TE', 'FB', 'K', 'HB'])]
+    return raw
 
 # Create table for player identity
-identity = raw[['player_id','player_name','position']].drop_duplicates().dropna(subset=['player_id','position']).reset_index(drop=True)
-identity[identity['position'] == 'FB'] = 'RB'
-identity[identity['position'] == 'HB'] = 'RB'
+def build_identity(raw):
+    identity = raw[['player_id','player_name','position']].drop_duplicates().dropna(subset=['player_id','position']).reset_index(drop=True)
+    identity[identity['position'] == 'FB'] = 'RB'
+    identity[identity['position'] == 'HB'] = 'RB'
+    return identity
+
+# identity followed by the players of old identity it does not have, e.g. from seasons that are
+# in the tables but not in the raw cache
+def merge_identity(old, identity):
+    if old is None:
+        return identity
+    old = old[~old['player_id'].isin(identity['player_id'])]
+    return pd.concat([identity, old], ignore_index=True)
 
 # Create table for weekly stats
-weekly = raw[['player_id', 'recent_team', 'season', 'week', 'opponent_team',
-       'passing_yards', 'passing_tds', 'interceptions', 'sack_fumbles_lost',
-       'passing_2pt_conversions', 'rushing_yards', 'rushing_tds', 'rushing_fumbles_lost',
-       'rushing_2pt_conversions', 'receptions', 'receiving_yards', 'receiving_tds', 'receiving_fumbles_lost',
-       'receiving_2pt_conversions', 'fantasy_points_ppr']]
-
-weekly['fumbles'] = weekly['sack_fumbles_lost'] + weekly['rushing_fumbles_lost'] + weekly['receiving_fumbles_lost']
-weekly = weekly.drop(columns=['sack_fumbles_lost', 'rushing_fumbles_lost','receiving_fumbles_lost'])
-weekly['2pt'] = weekly['passing_2pt_conversions'] + weekly['rushing_2pt_conversions'] + weekly['receiving_2pt_conversions']
-weekly = weekly.drop(columns=['passing_2pt_conversions', 'rushing_2pt_conversions', 'receiving_2pt_conversions'])
-
-# Create table for yearly stats
-yearly = weekly.drop(columns=['opponent_team'])
-yearly = yearly.groupby(['player_id','season']).agg({
-    'recent_team':'first',
-    'week':'count',
-    'passing_yards':'sum',
-    'passing_tds':'sum',
-    'interceptions':'sum',
-    'rushing_yards':'sum',
-    'rushing_tds':'sum',
-    'receptions':'sum',
-    'receiving_yards':'sum',
-    'receiving_tds':'sum',
-    'fantasy_points_ppr':'sum',
-    'fumbles':'sum',
-    '2pt':'sum'
-}).reset_index()
-
-# Captures weeks per season
-season = yearly.groupby('season').agg({
-    'week':'max'
-})
-
-# add total weeks to yearly stats
-yearly = yearly.join(season, on='season', rsuffix='_total')
-
-# Find standard deviation of fantasy points per player per season
-small_table = weekly[['player_id','season','fantasy_points_ppr']]
-small_table= small_table.groupby(['player_id','season']).agg(std_dev=pd.NamedAgg(column="fantasy_points_ppr", aggfunc="std")).reset_index()
-yearly = yearly.join(small_table.set_index(['player_id','season']), on=['player_id','season'])
+def build_weekly(raw):
+    weekly = raw[['player_id', 'recent_team', 'season', 'week', 'opponent_team',
+           'passing_yards', 'passing_tds', 'interceptions', 'sack_fumbles_lost',
+           'passing_2pt_conversions', 'rushing_yards', 'rushing_tds', 'rushing_fumbles_lost',
+           'rushing_2pt_conversions', 'receptions', 'receiving_yards', 'receiving_tds', 'receiving_fumbles_lost',
+           'receiving_2pt_conversions', 'fantasy_points_ppr']].copy()
+    weekly['fumbles'] = weekly['sack_fumbles_lost'] + weekly['rushing_fumbles_lost'] + weekly['receiving_fumbles_lost']
+    weekly = weekly.drop(columns=['sack_fumbles_lost', 'rushing_fumbles_lost','receiving_fumbles_lost'])
+    weekly['2pt'] = weekly['passing_2pt_conversions'] + weekly['rushing_2pt_conversions'] + weekly['receiving_2pt_conversions']
+    weekly = weekly.drop(columns=['passing_2pt_conversions', 'rushing_2pt_conversions', 'receiving_2pt_conversions'])
+    return weekly
+
+# Create table for yearly stats, every season is aggregated on its own
+def build_yearly(weekly):
+    yearly = weekly.drop(columns=['opponent_team'])
+    yearly = yearly.groupby(['player_id','season']).agg({
+        'recent_team':'first',
+        'week':'count',
+        'passing_yards':'sum',
+        'passing_tds':'sum',
+        'interceptions':'sum',
+        'rushing_yards':'sum',
+        'rushing_tds':'sum',
+        'receptions':'sum',
+        'receiving_yards':'sum',
+        'receiving_tds':'sum',
+        'fantasy_points_ppr':'sum',
+        'fumbles':'sum',
+        '2pt':'sum'
+    }).reset_index()
+
+    # add total weeks to yearly stats
+    yearly['week_total'] = week_totals(yearly)
+
+    # Find standard deviation of fantasy points per player per season
+    small_table = weekly[['player_id','season','fantasy_points_ppr']]
+    small_table= small_table.groupby(['player_id','season']).agg(std_dev=pd.NamedAgg(column="fantasy_points_ppr", aggfunc="std")).reset_index()
+    yearly = yearly.join(small_table.set_index(['player_id','season']), on=['player_id','season'])
+    return yearly
+
+# Captures weeks per season, the most weeks any player of the season played, for every yearly row
+def week_totals(yearly):
+    return yearly.groupby('season')['week'].transform('max')
 
 # Create overall stats table with only the most important data
-overall = yearly[['player_id','season','week_total','fantasy_points_ppr','std_dev']]
-overall['ppg'] = overall['fantasy_points_ppr'] / overall['week_total']
-overall = overall.drop(columns=['fantasy_points_ppr','week_total'])
-# fill missing standard deviations with -1 (right now no filling is done)
-# overall = overall.fillna({'std_dev': -1})
-# Save the tables to CSV files
-identity.to_csv('data/player_identity.csv', index=False)
-weekly.to_csv('data/weekly_stats.csv', index=False)
-yearly.to_csv('data/yearly_stats.csv', index=False)
-overall.to_csv('data/overall_stats.csv', index=False)
\ No newline at end of file
+def build_overall(yearly):
+    overall = yearly[[player_key(yearly),'season','week_total','fantasy_points_ppr','std_dev']].copy()
+    overall['ppg'] = overall['fantasy_points_ppr'] / overall['week_total']
+    overall = overall.drop(columns=['fantasy_points_ppr','week_total'])
+    # fill missing standard deviations with -1 (right now no filling is done)
+    # overall = overall.fillna({'std_dev': -1})
+    return overall
+
+# rows of old outside seasons followed by new, in season order
+def replace_seasons(old, new, seasons):
+    if old is None:
+        return new.reset_index(drop=True)
+    old = old[~old['season'].isin(seasons)]
+    return pd.concat([old, new], ignore_index=True).sort_values(by='season', kind='stable').reset_index(drop=True)
+
+def read_table(table):
+    path = csv_path(table)
+    return pd.read_csv(path) if os.path.exists(path) else None
+
+# Bring the tables up to date for seasons
+# Fetches stale seasons into the raw cache and re-aggregates only those seasons, unless the
+# tables do not exist yet or force is set, in which case every season is rebuilt from the cache.
+# Identity always covers every cached season, plus the players of the old identity table.
+def main(seasons=SEASONS, fetcher=nfl_fetcher, refresh=(), workers=8, force=False, raw_dir=RAW_DIR):
+    seasons = list(seasons)
+    stale = stale_seasons(seasons, refresh, raw_dir=raw_dir)
+    fetch_seasons(stale, fetcher, workers, raw_dir)
+    old = {table: read_table(table) for table in ['identity', 'weekly', 'yearly', 'overall']}
+    rebuild = stale
+    if force or any(old[table] is None for table in ['weekly', 'yearly', 'overall']):
+        old = dict.fromkeys(old)
+        rebuild = seasons
+    if not rebuild:
+        print('Tables are up to date')
+        return
+    with stage('create_base_tables.filter'):
+        raw = filter_raw(load_raw(rebuild, raw_dir))
+    with stage('create_base_tables.identity'):
+        players = load_raw(cached_seasons(raw_dir), raw_dir, ['player_id', 'player_name', 'position', 'season_type'])
+        identity = merge_identity(old['identity'], build_identity(filter_raw(players)))
+    with stage('create_base_tables.weekly'):
+        weekly = build_weekly(raw)
+    with stage('create_base_tables.yearly'):
+        yearly = build_yearly(weekly)
+    with stage('create_base_tables.overall'):
+        overall = build_overall(yearly)
+    weekly = replace_seasons(old['weekly'], weekly, rebuild)
+    yearly = replace_seasons(old['yearly'], yearly, rebuild)
+    overall = replace_seasons(old['overall'], overall, rebuild)
+    with stage('create_base_tables.save'):
+        # Save the tables to CSV files
+        identity.to_csv(csv_path('identity'), index=False)
+        weekly.to_csv(csv_path('weekly'), index=False)
+        yearly.to_csv(csv_path('yearly'), index=False)
+        overall.to_csv(csv_path('overall'), index=False)
+        # Mirror the tables into the columnar store used by load_data, which gives every player an
+        # int32 player_code and stores team/position as categoricals and stats in narrow dtypes
+        save_tables(identity, weekly, yearly, overall)
+    print(f'Rebuilt seasons {rebuild}')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fetch weekly data and build the base tables')
+    parser.add_argument('--seasons', nargs=2, type=int, default=[SEASONS.start, SEASONS.stop - 1], metavar=('FIRST', 'LAST'))
+    parser.add_argument('--refresh', nargs='*', type=int, default=[])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--source', default=None, help='directory of weekly_<season> files to use instead of nflverse')
+    # read by profiling when it is imported
+    parser.add_argument('--profile', action='store_true', help='print per-stage time and memory at exit')
+    args = parser.parse_args()
+    fetcher = file_fetcher(args.source) if args.source else nfl_fetcher
+    main(range(args.seasons[0], args.seasons[1] + 1), fetcher, args.refresh, args.workers, args.force)
@@ -0,0 +1,190 @@
+# Columnar storage for the tables written by create_base_tables.py
+# Each table is a directory of .npy files (one per column) sorted by season plus a meta.json
+# holding the column order and the row range of every season, so a subset of seasons and
+# columns can be memory-mapped without parsing any text.
+# Tables are stored lean: every player_id gets an int32 player_code from one append-only registry
+# shared by all tables so joins compare integers, team and position columns are categoricals and
+# stats are downcast to int16/int32 when they are whole numbers and float32 otherwise.
+import json
+import os
+import numpy as np
+import pandas as pd
+from profiling import profiled
+
+DATA_DIR = 'data'
+STORE_DIR = os.path.join(DATA_DIR, 'columnar')
+TABLES = {
+    'identity': 'player_identity',
+    'weekly': 'weekly_stats',
+    'yearly': 'yearly_stats',
+    'overall': 'overall_stats'
+}
+
+# every player_id ever stored, a player's code is its position in this array
+CODES_PATH = os.path.join(STORE_DIR, 'player_codes.npy')
+# bumped whenever the stored layout changes so older stores are rebuilt
+STORE_VERSION = 2
+# text columns with few distinct values
+CATEGORICAL = ['position', 'recent_team', 'opponent_team']
+
+def csv_path(table):
+    return os.path.join(DATA_DIR, f'{TABLES[table]}.csv')
+
+def table_dir(table):
+    return os.path.join(STORE_DIR, TABLES[table])
+
+# player id registry, empty before the first table is stored
+def player_codes():
+    if not os.path.exists(CODES_PATH):
+        return np.array([], dtype=object)
+    return np.load(CODES_PATH).astype(object)
+
+# Column that identifies players in data: the int32 player_code of tables from the store, or
+# player_id for tables read straight from csv. Codes only turn back into ids at the edges,
+# player_codes()[code] is the id of a code.
+def player_key(data):
+    return 'player_code' if 'player_code' in data.columns else 'player_id'
+
+# int32 codes of ids in registry, appending ids it has not seen; missing ids get -1
+# Returns (codes, registry)
+def intern_ids(ids, registry):
+    ids = pd.Series(ids, dtype=object)
+    known = pd.Index(registry)
+    new = pd.Index(ids.dropna().unique()).difference(known).sort_values()
+    registry = np.concatenate([np.asarray(registry, dtype=object), new.to_numpy(dtype=object)])
+    codes = pd.Index(registry).get_indexer(ids)
+    return codes.astype(np.int32), registry
+
+# smallest of int16/int32 for whole numbers without gaps, float32 for everything else
+def _lean_numeric(series):
+    values = series.to_numpy()
+    if values.dtype.kind == 'f':
+        if series.isna().any() or not np.array_equal(values, np.round(values)):
+            return series.astype(np.float32)
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            return series.astype(dtype)
+    return series
+
+# Lean copy of a table: player_code after player_id, categorical text, downcast stats
+# Returns (data, registry) with any new player ids appended to registry
+def lean_table(data, registry):
+    data = data.copy()
+    for col in data.columns:
+        if col in CATEGORICAL:
+            data[col] = data[col].astype('category')
+        elif col != 'player_code' and pd.api.types.is_numeric_dtype(data[col]) and not pd.api.types.is_bool_dtype(data[col]):
+            data[col] = _lean_numeric(data[col])
+    if 'player_id' in data.columns:
+        codes, registry = intern_ids(data['player_id'], registry)
+        data = data.drop(columns='player_code', errors='ignore')
+        data.insert(data.columns.get_loc('player_id') + 1, 'player_code', codes)
+    return data, registry
+
+# lean copies of several tables sharing one in-memory registry, e.g. for generated data
+def lean_tables(*tables, registry=None):
+    registry = np.array([], dtype=object) if registry is None else registry
+    lean = []
+    for data in tables:
+        data, registry = lean_table(data, registry)
+        lean.append(data)
+    return tuple(lean)
+
+# text columns are stored as fixed width unicode so they can be memory-mapped too
+# categoricals are stored as their integer codes with the categories in meta.json
+def _column_array(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy()
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy()
+    return series.astype(object).where(series.notna(), '').astype(str).to_numpy(dtype=str)
+
+def _column_series(values, name, categories=None):
+    if categories is not None:
+        return pd.Series(pd.Categorical.from_codes(np.asarray(values), categories), name=name)
+    if values.dtype.kind == 'U':
+        values = np.asarray(values)
+        series = pd.Series(values.astype(object), name=name)
+        return series.where(values != '', np.nan)
+    return pd.Series(np.asarray(values), name=name)
+
+# write one table to the store, sorted by season when it has one
+def write_table(table, data):
+    path = table_dir(table)
+    os.makedirs(path, exist_ok=True)
+    registry = player_codes()
+    data, grown = lean_table(data, registry)
+    if len(grown) > len(registry):
+        np.save(CODES_PATH, grown.astype(str), allow_pickle=False)
+    seasons = {}
+    if 'season' in data.columns:
+        data = data.sort_values(by='season', kind='stable').reset_index(drop=True)
+        values = data['season'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+        stops = np.r_[starts[1:], len(values)]
+        seasons = {str(values[a]): [int(a), int(b)] for a, b in zip(starts, stops)}
+    for col in data.columns:
+        np.save(os.path.join(path, f'{col}.npy'), _column_array(data[col]), allow_pickle=False)
+    categories = {col: data[col].cat.categories.tolist() for col in data.columns
+                  if isinstance(data[col].dtype, pd.CategoricalDtype)}
+    meta = {'version': STORE_VERSION, 'columns': list(data.columns), 'rows': len(data),
+            'seasons': seasons, 'categories': categories}
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+def save_tables(identity, weekly, yearly, overall):
+    for table, data in zip(TABLES, [identity, weekly, yearly, overall]):
+        write_table(table, data)
+
+def _stale(meta, source):
+    if not os.path.exists(meta) or os.path.getmtime(meta) < os.path.getmtime(source):
+        return True
+    with open(meta) as f:
+        return json.load(f).get('version') != STORE_VERSION
+
+# (re)build the store from the csv files, only for tables whose csv is newer than the store
+def build_store(force=False, tables=TABLES):
+    for table in tables:
+        source = csv_path(table)
+        meta = os.path.join(table_dir(table), 'meta.json')
+        if not os.path.exists(source):
+            continue
+        if force or _stale(meta, source):
+            write_table(table, pd.read_csv(source))
+
+# seasons stored for a table, in order
+def stored_seasons(table):
+    build_store(tables=[table])
+    with open(os.path.join(table_dir(table), 'meta.json')) as f:
+        return sorted(int(season) for season in json.load(f)['seasons'])
+
+# load a single table, restricted to the given seasons and columns
+@profiled()
+def load_table(table, seasons=None, columns=None):
+    build_store(tables=[table])
+    path = table_dir(table)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if columns is None:
+        columns = meta['columns']
+    rows = None
+    if seasons is not None and meta['seasons']:
+        ranges = [meta['seasons'][str(s)] for s in seasons if str(s) in meta['seasons']]
+        if len(ranges) == 1:
+            rows = slice(*ranges[0])
+        else:
+            rows = np.concatenate([np.arange(a, b) for a, b in ranges] + [np.arange(0)])
+    data = {}
+    for col in columns:
+        values = np.load(os.path.join(path, f'{col}.npy'), mmap_mode='r')
+        if rows is not None:
+            values = values[rows]
+        data[col] = _column_series(values, col, meta.get('categories', {}).get(col))
+    return pd.DataFrame(data, columns=columns)
+
+# Load the base tables; columns is an optional dict of table name to the columns needed
+@profiled()
+def load_data(seasons=None, columns=None):
+    columns = columns or {}
+    return tuple(load_table(table, seasons, columns.get(table)) for table in TABLES)
@@ -0,0 +1,81 @@
+# Derived tables shared by the analysis scripts, memoized on disk by cache.memoize
+import pandas as pd
+from cache import memoize
+from data_store import load_table
+from leaderboard import Leaderboard
+from replacement import replacement_stats, par
+
+# depth chart groups ppg is ranked in by trim_players
+TEAM_GROUPS = ('season', 'position', 'recent_team')
+
+# narrow down to WR1, WR2, TE1, RB1, RB2, QB1 and rename positions to match
+# board is an optional Leaderboard of ppg by TEAM_GROUPS over data, e.g. leaderboard('team_players', ...)
+def trim_players(data, board=None):
+    if board is None:
+        board = Leaderboard(data, 'ppg', TEAM_GROUPS)
+    data['rank'] = board.ranks().astype('Int64')
+    
+    data['position']= data['position'].astype(str) + data['rank'].astype(str)
+    data.drop(columns='rank')
+    data = data[data.position.isin(['QB1','TE1','RB1','RB2','WR1','WR2'])]
+    return data
+
+# yearly rows with identity and ppg, the table trim_players ranks
+# tables are joined on the integer player_code, player_id comes along from yearly
+def team_players(yearly, identity, overall):
+    yearly = yearly[['player_id','player_code','season','recent_team']]
+    overall = overall[['player_code','ppg','season']]
+    identity = identity.drop(columns='player_id')
+    data = yearly.merge(identity,on='player_code',how='left')
+    return pd.merge(left=data,right=overall,how='left',right_on=['player_code','season'],left_on=['player_code','season'])
+
+# Group positions together
+def groups(yearly,weekly,identity,overall,board=None):
+    weekly = weekly[['player_code','week','fantasy_points_ppr','season']]
+    #identify relevant players
+    data = team_players(yearly, identity, overall)
+    data = trim_players(data, board)
+    data = pd.merge(left=data,right=weekly,how='left',right_on=['player_code','season'],left_on=['player_code','season'])
+    return data
+
+# overall stats with player identity attached
+@memoize(version=2, sources=('identity', 'overall'))
+def players(seasons=None):
+    overall = load_table('overall', seasons)
+    identity = load_table('identity').drop(columns='player_id')
+    return overall.merge(identity, on='player_code', how='left')
+
+# replacement ppg per (season, position) for the league in assumptions.py
+@memoize(version=3, sources=('identity', 'overall'))
+def replacement_stats_table(seasons=None):
+    return replacement_stats(players(seasons), board=leaderboard('players', 'ppg', ('season', 'position'), seasons))
+
+# points above replacement for every player
+@memoize(version=3, sources=('identity', 'overall'))
+def par_table(seasons=None):
+    return par(players(seasons), replacement_stats_table(seasons))
+
+# weekly stats of the QB1/RB1/RB2/WR1/WR2/TE1 of every team
+@memoize(version=3)
+def top_player_table(seasons=None):
+    weekly = load_table('weekly', seasons, ['player_code','week','fantasy_points_ppr','season'])
+    board = leaderboard('team_players', 'ppg', TEAM_GROUPS, seasons)
+    data = trim_players(board.data.copy(), board)
+    return pd.merge(left=data,right=weekly,how='left',right_on=['player_code','season'],left_on=['player_code','season'])
+
+# yearly rows with identity and ppg of every player, see team_players
+@memoize(version=1, sources=('identity', 'yearly', 'overall'))
+def team_player_table(seasons=None):
+    identity = load_table('identity')
+    yearly = load_table('yearly', seasons, ['player_id','player_code','season','recent_team'])
+    overall = load_table('overall', seasons, ['player_code','ppg','season'])
+    return team_players(yearly, identity, overall)
+
+DERIVED = {'players': players, 'par': par_table, 'team_players': team_player_table}
+
+# Leaderboard of value within groups over one of the DERIVED tables, e.g.
+# leaderboard('par', 'par', ('season', 'position')). Memoized like the tables, so every caller of
+# the same (table, value, groups) shares one index instead of sorting the table again.
+@memoize(version=1, sources=('identity', 'yearly', 'overall'))
+def leaderboard(table, value, groups=(), seasons=None):
+    return Leaderboard(DERIVED[table](seasons), value, groups)
@@ -0,0 +1,91 @@
+# Array-backed draft engine
+# Every draft keeps one queue per position sorted by draft value and a head pointer into it.
+# A team always takes the best available player at some position it still needs, so the next
+# pick is the best queue head among the positions the team is allowed to fill, and the queues
+# only ever advance from the front. Many independent drafts run together along the first axis.
+import numpy as np
+import pandas as pd
+from assumptions import team_composition
+from data_store import player_key
+
+DRAFT_POSITIONS = ['QB', 'RB', 'WR', 'TE']
+
+# team picking at each turn of the draft
+# snake: order reverses every round, linear: same order every round,
+# sequential: each team fills its whole roster before the next team picks
+def pick_order(teams, rounds, style='snake'):
+    if style == 'snake':
+        return np.concatenate([np.arange(teams)[::-1] if r % 2 == 1 else np.arange(teams) for r in range(rounds)])
+    if style == 'linear':
+        return np.tile(np.arange(teams), rounds)
+    if style == 'sequential':
+        return np.repeat(np.arange(teams), rounds)
+    raise ValueError(f'Unknown draft style {style}')
+
+# values is (drafts, players) draft value per player, -inf for players that are not available
+# positions is (players,) of position names
+# ids is optional (players,) player ids; rows sharing an id (a player listed at two positions)
+# can only be drafted once, which is tracked by the taken bitmap
+# Returns picks as (drafts, teams, rounds) indices into the players and the taken bitmap.
+def run_drafts(values, positions, teams, style='snake', composition=team_composition, ids=None):
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    positions = np.asarray(positions)
+    n_drafts = values.shape[0]
+    codes = np.arange(values.shape[1]) if ids is None else pd.factorize(np.asarray(ids))[0]
+    limits = np.array([composition[p] for p in DRAFT_POSITIONS])
+    rounds = int(limits.sum())
+    # per-position queues sorted by value, padded with -inf so a head can run off the end
+    # no draft can go deeper than teams x limit into a queue, plus players it skips as taken
+    members = [np.flatnonzero(positions == p) for p in DRAFT_POSITIONS]
+    shared = len(codes) - len(np.unique(codes))
+    depths = [min(len(m), teams * limit + shared) for m, limit in zip(members, limits)]
+    queue = np.zeros((n_drafts, len(DRAFT_POSITIONS), max(depths) + 1), dtype=np.int64)
+    queue_values = np.full(queue.shape, -np.inf)
+    for p, (m, depth) in enumerate(zip(members, depths)):
+        order = np.argsort(-values[:, m], axis=1, kind='stable')[:, :depth]
+        queue[:, p, :depth] = m[order]
+        queue_values[:, p, :depth] = np.take_along_axis(values[:, m], order, axis=1)
+    heads = np.zeros((n_drafts, len(DRAFT_POSITIONS)), dtype=np.int64)
+    counts = np.zeros((n_drafts, teams, len(DRAFT_POSITIONS)), dtype=np.int64)
+    taken = np.zeros((n_drafts, codes.max(initial=-1) + 1), dtype=bool)
+    picks = np.zeros((n_drafts, teams, rounds), dtype=np.int64)
+    drafts = np.arange(n_drafts)
+    slots = np.arange(len(DRAFT_POSITIONS))
+    for team in pick_order(teams, rounds, style):
+        # skip queue heads already drafted under another position
+        while True:
+            live = np.isfinite(queue_values[drafts[:, None], slots, heads])
+            skip = live & taken[drafts[:, None], codes[queue[drafts[:, None], slots, heads]]]
+            if not skip.any():
+                break
+            heads += skip
+        head_values = queue_values[drafts[:, None], slots, heads]
+        head_values[counts[:, team] >= limits] = -np.inf
+        pos = head_values.argmax(axis=1)
+        if np.isneginf(head_values[drafts, pos]).any():
+            raise ValueError('Ran out of players to draft')
+        player = queue[drafts, pos, heads[drafts, pos]]
+        picks[drafts, team, counts[drafts, team].sum(axis=1)] = player
+        taken[drafts, codes[player]] = True
+        heads[drafts, pos] += 1
+        counts[drafts, team, pos] += 1
+    return picks, taken
+
+# Single draft in the row order of par_data, the array version of walking par_data.iloc
+def draft_table(teams, par_data, style='snake', composition=team_composition):
+    values = -np.arange(len(par_data), dtype=float)
+    ids = par_data[player_key(par_data)].to_numpy()
+    picks, _ = run_drafts(values, par_data['position'], teams, style, composition, ids=ids)
+    return [list(ids[team]) for team in picks[0]]
+
+# n_drafts independent drafts of one season, each with its own add_noise perturbation of par
+# Returns (drafts, teams, rounds) player keys, player_code when par_data has it.
+# composition sets the players drafted per position, e.g. lineup.roster_limits for benches
+def noisy_drafts(par_data, teams, n_drafts, season=2024, noise=4, rng=None, style='snake', composition=team_composition):
+    rng = rng if rng is not None else np.random.default_rng()
+    data = par_data[par_data['season'] == season].reset_index(drop=True)
+    values = data['par'].to_numpy() + rng.normal(0, noise, size=(n_drafts, len(data)))
+    values[np.isnan(values)] = -np.inf
+    ids = data[player_key(data)].to_numpy()
+    picks, _ = run_drafts(values, data['position'], teams, style, composition, ids=ids)
+    return ids[picks]
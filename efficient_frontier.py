@@ -1,44 +1,18 @@
 import pandas as pd
-from assumptions import last_pos, TEAMS, team_composition
+from data_store import load_table, player_key
+from derived import par_table
+from score_matrix import ScoreTensor
+from batch_sim import simulate_leagues, team_variances
+from draft_engine import DRAFT_POSITIONS, draft_table, noisy_drafts
+from assumptions import last_pos, TEAMS, team_composition, flex_positions
+from plotting import SCATTER_LIMIT, binned_scatter, binned_surface, export_figures, season_bands
+from profiling import profiled
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+from scipy.special import ndtr
 import random
-import time
 import itertools
-def load_data():
-    # Load the data from CSV files
-    identity = pd.read_csv('data/player_identity.csv')
-    weekly = pd.read_csv('data/weekly_stats.csv')
-    yearly = pd.read_csv('data/yearly_stats.csv')
-    overall = pd.read_csv('data/overall_stats.csv')
-    
-    return identity, weekly, yearly, overall
-
-# will return the ith largest value in a group, or 0 if there are not enough values
-def ith_largest_or_zero(group, i):
-    top_i = group.nlargest(i)
-    if len(top_i) < i:
-        return 0
-    return top_i.iloc[-1]
-
-# find stats for replacement player
-def replacement_stats(data):
-    replacement = {}
-    for pos in ['QB', 'RB', 'WR', 'TE', 'K']:
-        replacement[pos] = int(last_pos(pos))
-    return (data
-        .groupby(['season','position'])['ppg']
-        .apply(lambda x: ith_largest_or_zero(x, replacement[x.name[1]]))
-        .reset_index())
-
-# calculate points above replacement for each player
-def par(data, replacement):
-    data = data.merge(replacement, on=['season', 'position'], how='left', suffixes=('', '_replacement'))
-    data['par'] = data['ppg'] - data['ppg_replacement']
-    data = data.drop(columns=['ppg_replacement']) 
-    return data[['player_id', 'player_name','season', 'position', 'ppg', 'par']].sort_values(by=['season', 'par'], ascending=[False, False]).reset_index(drop=True)
-
 def add_noise(data, season= 2024, noise=4):
     data = data[data['season']==season].reset_index(drop=True)
     rng = np.random.default_rng()
@@ -47,59 +21,42 @@ def add_noise(data, season= 2024, noise=4):
 
 # Simulate a draft based on the points above replacement
 # par_data must be sorted by season and par
+@profiled()
 def sim_snake_draft(teams,par_data,season=2024):
-    team_counter = {'QB':0, 'RB':0, 'WR':0,'TE':0}
-    counters = []
-    rosters = []
     par_data = par_data[par_data['season'] == season].reset_index(drop=True)
-    for _ in range(teams):
-        counters.append(team_counter.copy())
-        rosters.append([])
-    rounds = team_composition['QB'] + team_composition['RB'] + team_composition['WR'] + team_composition['TE']
-    
-    for r in range(rounds):
-        for team in range(teams):
-            # Reverse order for odd rounds
-            if r % 2 == 1:
-                team = teams - 1 - team
-            # Find next best player
-            no_pick = True
-            pointer = 0
-            while no_pick:
-                next_pick = par_data.iloc[pointer]
-                if counters[team][next_pick['position']] < team_composition[next_pick['position']]:
-                    no_pick = False
-                    counters[team][next_pick['position']] += 1
-                    rosters[team].append(next_pick['player_id'])
-                    #print(f"Team {team} picks {next_pick['player_name']}")
-                    par_data = par_data.drop(index=pointer)
-                    par_data = par_data.reset_index(drop=True)
-                else:
-                    pointer += 1
-    return rosters
+    return draft_table(teams, par_data, style='snake')
 
 # returns the index of the team that won each week
-def sim_season(rosters, weekly,season=2024):
+# tensor is an optional ScoreTensor built from weekly, which skips the per-team filtering
+@profiled()
+def sim_season(rosters, weekly,season=2024,tensor=None):
+    if tensor is not None:
+        return tensor.season_frame(rosters, season)
+    key = player_key(weekly)
     weekly = weekly[weekly['season'] == season].reset_index(drop=True)
-    weekly = weekly[['player_id', 'week', 'fantasy_points_ppr']]
+    weekly = weekly[[key, 'week', 'fantasy_points_ppr']]
     team_num = 0
     teams = weekly[['week']].drop_duplicates().reset_index(drop=True)
     for team in rosters:
-        team_weekly = weekly[weekly['player_id'].isin(team)]
+        team_weekly = weekly[weekly[key].isin(team)]
         team_weekly = team_weekly.groupby('week')['fantasy_points_ppr'].sum().reset_index()
         team_weekly.rename(columns={'fantasy_points_ppr': f'{team_num}'}, inplace=True)
         teams = teams.merge(team_weekly, on='week', how='left')
         team_num += 1
     return teams.sort_values(by='week').set_index('week')
 
-# each team is a list of player ids
-def team_variance(teams,weekly,season=2024):
+# each team is a list of player keys, player codes for tables from the store
+@profiled()
+def team_variance(teams,weekly,season=2024,tensor=None):
+    if tensor is not None:
+        return list(team_variances(tensor, tensor.roster_slots(teams)[None], season)[0])
+    key = player_key(weekly)
     weekly = weekly[weekly['season'] == season].reset_index(drop=True)
-    weekly = weekly[['player_id', 'week', 'fantasy_points_ppr']]
+    weekly = weekly[[key, 'week', 'fantasy_points_ppr']]
     variances = []
     for team in teams:
-        team_weekly = weekly[weekly['player_id'].isin(team)]
-        team_weekly = team_weekly.pivot(index='week',columns='player_id', values='fantasy_points_ppr').fillna(0)
+        team_weekly = weekly[weekly[key].isin(team)]
+        team_weekly = team_weekly.pivot(index='week',columns=key, values='fantasy_points_ppr').fillna(0)
         n = len(team)
         cov_matrix = team_weekly.cov()
         var = np.ones(n).T @ cov_matrix @ np.ones(n)
@@ -107,67 +64,253 @@ def team_variance(teams,weekly,season=2024):
     return variances
 
 # Model wins as number of other teams beaten that week
+# teams is the sim_season frame or a weeks x teams array
+@profiled()
 def find_wins(teams):
-    scores = teams.values
+    scores = np.asarray(teams)
     wins_matrix = (scores[:, :, None] > scores[:, None, :]).sum(axis=2)
-    wins = pd.DataFrame(wins_matrix,index=teams.index,columns=teams.columns)
-    sum_wins = wins.sum(axis=0)
+    sum_wins = wins_matrix.sum(axis=0)
     return list(sum_wins)
 
-def total_points(rosters,weekly,season=2024):
+def total_points(rosters,weekly,season=2024,tensor=None):
+    if tensor is not None:
+        return list(tensor.team_scores(rosters, season).sum(axis=0))
     weekly = weekly[weekly['season']==season].reset_index(drop=True)
+    key = player_key(weekly)
     points = []
     for team in rosters:
-        team_weekly = weekly[weekly['player_id'].isin(team)]
+        team_weekly = weekly[weekly[key].isin(team)]
         points.append(team_weekly['fantasy_points_ppr'].sum())
     return points
 
+# Every way the flexible slots can be filled, as players needed per position
+def roster_shapes(composition=team_composition):
+    shapes = [tuple(composition.get(pos, 0) for pos in DRAFT_POSITIONS)]
+    for slot, eligible in flex_positions.items():
+        extended = []
+        for shape in shapes:
+            for extra in itertools.combinations_with_replacement(eligible, composition.get(slot, 0)):
+                extended.append(tuple(n + extra.count(pos) for n, pos in zip(shape, DRAFT_POSITIONS)))
+        shapes = extended
+    return sorted(set(shapes))
+
+# mask of the points not dominated in (higher mean, lower variance)
+def pareto_mask(means, variances):
+    order = np.lexsort((variances, -means))
+    best = np.minimum.accumulate(variances[order])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = variances[order][1:] < best[:-1]
+    mask = np.zeros(len(order), dtype=bool)
+    mask[order[keep]] = True
+    return mask
+
+# True where some frontier point has at least the mean and at most the variance
+def dominated(front_means, front_variances, means, variances):
+    if len(front_means) == 0:
+        return np.zeros(len(means), dtype=bool)
+    order = np.argsort(front_means)
+    suffix_min = np.minimum.accumulate(front_variances[order][::-1])[::-1]
+    first = np.searchsorted(front_means[order], means, side='left')
+    bound = np.append(suffix_min, np.inf)[first]
+    return variances >= bound
+
+# Rosters that are Pareto-optimal in (expected points, variance) for one season
+# The pool is the depth best players by par at each position of par_data (the available players),
+# variance is 1' S 1 over the season covariance as in team_variance and FLEX/SFLEX slots are
+# covered by trying every roster shape they allow. Each shape is a branch-and-bound over
+# positions: partial teams carry their centered weekly scores and are pruned when the best
+# points they could still reach and the lowest variance they could still reach are dominated
+# by a roster already on the frontier. frontier_check.py compares it with a brute-force search.
+def mean_variance_frontier(par_data, tensor, season=2024, composition=team_composition, depth=None, chunk=2**20):
+    par_data = par_data[(par_data['season'] == season) & par_data['position'].isin(DRAFT_POSITIONS)]
+    key = player_key(par_data)
+    par_data = par_data.sort_values(by='par', ascending=False).drop_duplicates(key)
+    matrix = tensor.season(season)
+    weeks = len(matrix)
+    centered = matrix - matrix.mean(axis=0)
+    shapes = roster_shapes(composition)
+    pools = {}
+    for i, pos in enumerate(DRAFT_POSITIONS):
+        n = depth[pos] if isinstance(depth, dict) else depth
+        if n is None:
+            n = int(last_pos(pos)/2)
+        n = max(n, max(shape[i] for shape in shapes))
+        pools[pos] = par_data[par_data['position'] == pos][key].to_numpy()[:n]
+    front = {'mean': np.zeros(0), 'variance': np.zeros(0), 'players': np.zeros((0, 0), dtype=object)}
+
+    def update(means, variances, players):
+        mask = ~dominated(front['mean'], front['variance'], means, variances)
+        if not mask.any():
+            return
+        size = max(front['players'].shape[1], players.shape[1])
+        pad = lambda a: np.hstack([a, np.full((len(a), size - a.shape[1]), None, dtype=object)])
+        means = np.append(front['mean'], means[mask])
+        variances = np.append(front['variance'], variances[mask])
+        players = np.vstack([pad(front['players']), pad(players[mask])])
+        keep = pareto_mask(means, variances)
+        front.update({'mean': means[keep], 'variance': variances[keep], 'players': players[keep]})
+
+    for shape in shapes:
+        # one level per position in the shape: (combinations, k) ids, centered weekly scores and mean
+        levels = []
+        for pos, k in zip(DRAFT_POSITIONS, shape):
+            if k == 0:
+                continue
+            pool = pools[pos]
+            if len(pool) < k:
+                raise ValueError(f'Not enough {pos} in the pool for {k} roster spots')
+            combos = np.array(list(itertools.combinations(range(len(pool)), k)))
+            slots = tensor.slots(pool)[combos]
+            levels.append((pool[combos], centered[:, slots].sum(axis=2).T, matrix[:, slots].sum(axis=2).mean(axis=0)))
+        # smallest levels first keeps the partial teams few
+        levels.sort(key=lambda level: len(level[2]))
+        sds = [np.sqrt((level[1]**2).sum(axis=1) / (weeks - 1)) for level in levels]
+        rest_mean = [sum(level[2].max() for level in levels[i + 1:]) for i in range(len(levels))]
+        # seed the frontier with the best combination per position for a sweep of risk aversions
+        for risk in np.r_[0, np.geomspace(1e-3, 10, 20)]:
+            pick = [np.argmax(level[2] - risk * sd**2) for level, sd in zip(levels, sds)]
+            weekly = sum(level[1][p] for level, p in zip(levels, pick))
+            update(np.array([sum(level[2][p] for level, p in zip(levels, pick))]),
+                   np.array([(weekly**2).sum() / (weeks - 1)]),
+                   np.concatenate([level[0][p] for level, p in zip(levels, pick)])[None])
+
+        # The last level is searched exactly: with its combinations b as the columns of
+        # (2 b, ||b||^2), one product with (w, 1) gives ||w + b||^2 - ||w||^2 for every b, so the
+        # lowest variance any completion of a partial team w reaches is a row minimum. Partial teams
+        # are dropped on that minimum before their completions are paired with the means.
+        last_ids, last_weekly, last_mean = levels[-1]
+        last = np.hstack([2 * last_weekly, (last_weekly**2).sum(axis=1)[:, None]]).T
+        rows = max(1, chunk // len(last_mean))
+
+        # players(r) are the ids of rows r of the partial teams w
+        def finish(w, m_w, players):
+            for start in range(0, len(m_w), rows):
+                a, m_a = w[start:start + rows], m_w[start:start + rows]
+                norm = (a**2).sum(axis=1)
+                cross = np.hstack([a, np.ones((len(a), 1))]) @ last
+                low = (norm + cross.min(axis=1)) / (weeks - 1)
+                keep = np.flatnonzero(~dominated(front['mean'], front['variance'], m_a + last_mean.max(), low))
+                if len(keep) == 0:
+                    continue
+                variance = (norm[keep, None] + cross[keep]) / (weeks - 1)
+                m = m_a[keep, None] + last_mean
+                parent, child = np.nonzero(~dominated(front['mean'], front['variance'], m, variance))
+                update(m[parent, child], variance[parent, child], np.hstack([players(start + keep[parent]), last_ids[child]]))
+
+        def search(i, weekly, means, players):
+            ids, level_weekly, level_mean = levels[i]
+            step = max(1, chunk // len(level_mean))
+            for start in range(0, len(means), step):
+                a, m_a, p_a = weekly[start:start + step], means[start:start + step], players[start:start + step]
+                parent = np.repeat(np.arange(len(a)), len(level_mean))
+                child = np.tile(np.arange(len(level_mean)), len(a))
+                w = a[parent] + level_weekly[child]
+                m = m_a[parent] + level_mean[child]
+                if i == len(levels) - 2:
+                    finish(w, m, lambda r: np.hstack([p_a[parent[r]], ids[child[r]]]))
+                    continue
+                # ||a + b|| >= u.(a + b) with u = a/||a||, and u.b is at least the sum over the
+                # remaining positions of the most negative projection of any combination
+                norm = np.sqrt((w**2).sum(axis=1))
+                u = w / np.where(norm > 0, norm, 1)[:, None]
+                reach = norm + sum((u @ level[1].T).min(axis=1) for level in levels[i + 1:])
+                low = np.maximum(reach, 0)**2 / (weeks - 1)
+                keep = np.flatnonzero(~dominated(front['mean'], front['variance'], m + rest_mean[i], low))
+                if len(keep):
+                    search(i + 1, w[keep], m[keep], np.hstack([p_a[parent[keep]], ids[child[keep]]]))
+
+        if len(levels) == 1:
+            finish(np.zeros((1, weeks)), np.zeros(1), lambda r: np.zeros((len(r), 0), dtype=object))
+        else:
+            search(0, np.zeros((1, weeks)), np.zeros(1), np.zeros((1, 0), dtype=object))
+
+    names = par_data.set_index(key)['player_name']
+    order = np.argsort(front['mean'])
+    players = [[p for p in row if p is not None] for row in front['players'][order]]
+    return pd.DataFrame({
+        'players': players,
+        'player_names': [list(names.reindex(team)) for team in players],
+        'points': front['mean'][order] * weeks,
+        'variance': front['variance'][order]
+    })
+
+# teams is the sim_season frame, or (leagues, weeks, teams) weekly scores of many simulated
+# leagues which are drawn as percentile bands
+@profiled()
 def graph_season(teams):
-    fig = px.line(teams,x='week', y=teams.columns[1:], title='Fantasy Points per Week')
+    if isinstance(teams, np.ndarray) and teams.ndim == 3:
+        fig = season_bands(teams)
+    else:
+        fig = px.line(teams,x='week', y=teams.columns[1:], title='Fantasy Points per Week')
     fig.write_image('figures/per_week.png')
 
-def var_test():
-    SIZE = 10000
-    SAMPLES = 10000
+# Wins of a N(u1 + alpha, e*v1) team against a N(u1, v1) team over samples weeks
+# mode 'full' draws the whole size x samples arrays at once, 'stream' draws them in
+# block x block pieces so memory stays bounded, and 'analytic' evaluates the expected wins
+# samples * Phi(alpha / sqrt(v1 + e*v1)) exactly on a regular alpha/e grid of size points.
+def var_test(mode='stream', size=10000, samples=10000, block=1000):
     rng = np.random.default_rng()
-    alpha = np.random.uniform(low=-2.5,high=2.5,size=SIZE)
     u1 = 0
-    u2 = np.reshape(u1 + alpha,(SIZE,1))
-    e = np.random.uniform(low=1,high=100,size=SIZE)
     v1 = 1
-    v2 = np.reshape(e*v1,(SIZE,1))
-    primary = rng.normal(u1,np.sqrt(v1),(SIZE,SAMPLES))
-    secondary = rng.normal(u2,np.sqrt(v2),(SIZE,SAMPLES))
-    wins = np.sum(secondary>primary,axis=1)
+    if mode == 'analytic':
+        side = int(np.sqrt(size))
+        alpha, e = np.meshgrid(np.linspace(-2.5,2.5,side), np.linspace(1,100,side))
+        wins = samples * ndtr(alpha / np.sqrt(v1 + e*v1))
+        fig = go.Figure(go.Heatmap(x=alpha[0], y=e[:,0], z=wins, colorbar={'title':'wins'}))
+        fig.update_layout(xaxis_title='alpha', yaxis_title='e')
+        fig3D = go.Figure(go.Surface(x=alpha[0], y=e[:,0], z=wins))
+        fig3D.update_layout(scene={'xaxis_title':'alpha','yaxis_title':'e','zaxis_title':'wins'})
+        export_figures({'figures/var_test.png': fig, 'figures/3d.html': fig3D, 'figures/3d_var_test.png': fig3D})
+        return
+    alpha = np.random.uniform(low=-2.5,high=2.5,size=size)
+    u2 = np.reshape(u1 + alpha,(size,1))
+    e = np.random.uniform(low=1,high=100,size=size)
+    v2 = np.reshape(e*v1,(size,1))
+    if mode == 'full':
+        primary = rng.normal(u1,np.sqrt(v1),(size,samples))
+        secondary = rng.normal(u2,np.sqrt(v2),(size,samples))
+        wins = np.sum(secondary>primary,axis=1)
+    else:
+        wins = np.zeros(size, dtype=np.int64)
+        for row in range(0, size, block):
+            rows = slice(row, row + block)
+            for col in range(0, samples, block):
+                n = min(block, samples - col)
+                primary = rng.normal(u1,np.sqrt(v1),(len(u2[rows]),n))
+                secondary = rng.normal(u2[rows],np.sqrt(v2[rows]),(len(u2[rows]),n))
+                wins[rows] += np.sum(secondary>primary,axis=1)
     data = pd.DataFrame({'alpha':alpha,'e':e,'wins':wins})
-    fig = px.scatter(data,x='alpha',y='e',color='wins')
-    fig.write_image('figures/var_test.png')
-    fig3D = px.scatter_3d(data,x='alpha',y='e',z='wins',color='wins')
-    fig3D.write_html('figures/3d.html')
-    fig3D.write_image('figures/3d_var_test.png')
+    # past SCATTER_LIMIT points the figures show binned means instead of every point
+    if size > SCATTER_LIMIT:
+        fig = binned_scatter(data,'alpha','e',color='wins')
+        fig3D = binned_surface(data,'alpha','e','wins')
+    else:
+        fig = px.scatter(data,x='alpha',y='e',color='wins')
+        fig3D = px.scatter_3d(data,x='alpha',y='e',z='wins',color='wins')
+    export_figures({'figures/var_test.png': fig, 'figures/3d.html': fig3D, 'figures/3d_var_test.png': fig3D})
 
 def main():
-    identity, weekly, yearly, overall = load_data()
-    overall = overall.merge(identity, on='player_id', how='left')
-    # Calculate replacement stats
-    replacement = replacement_stats(overall)
-    
-    # Calculate points above replacement
-    par_results = par(overall, replacement)
+    SZN = [2019,2020,2021,2022,2023,2024]
+    weekly = load_table('weekly', SZN)
+    # Points above replacement, cached on disk
+    par_results = par_table(SZN)
     # real players only
     par_results = par_results[par_results['position'].isin(['QB','RB','WR','TE'])]
-    SZN = [2019,2020,2021,2022,2023,2024]
-    v,p,w = [],[],[]
-    for i in range(100):
-        season = random.sample(SZN,1)
-        season = season[0]
-        season_results = add_noise(par_results,season).sort_values(by='par_noise', ascending=False).reset_index(drop=True)
-        rosters = sim_snake_draft(TEAMS,season_results,season)
-        v.extend(team_variance(rosters,weekly,season))
-        p.extend(total_points(rosters,weekly,season))
-        w.extend(find_wins(sim_season(rosters,weekly,season)))
-    outcomes = pd.DataFrame({"points":p,"variance":v,"wins":w})
-    fig = px.scatter(outcomes,x='points',y='wins',color='variance')
+    tensor = ScoreTensor(weekly)
+    slots,seasons = [],[]
+    trials = pd.Series([random.sample(SZN,1)[0] for i in range(100)]).value_counts()
+    # all drafts of a season run together, each with its own noise
+    for season, n in trials.items():
+        drafts = noisy_drafts(par_results, TEAMS, n, season=season)
+        slots.append(tensor.slots(drafts.ravel()).reshape(drafts.shape))
+        seasons.extend([season]*n)
+    # score every league in one batch
+    results = simulate_leagues(tensor, np.concatenate(slots), np.array(seasons))
+    outcomes = pd.DataFrame({"points":results['points'].ravel(),"variance":results['variance'].ravel(),"wins":results['wins'].ravel()})
+    if len(outcomes) > SCATTER_LIMIT:
+        fig = binned_scatter(outcomes,'points','wins',color='variance')
+    else:
+        fig = px.scatter(outcomes,x='points',y='wins',color='variance')
     fig.write_image('figures/E-V.png')
     
 if __name__ == "__main__":
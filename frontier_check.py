@@ -0,0 +1,96 @@
+# Check mean_variance_frontier against a brute-force Pareto search
+# Every roster of every roster shape is built from the same per-position pools and scored
+# directly from its weekly totals, then the rosters no other roster beats on both points and
+# variance are compared with the frontier. Pools are kept to depth players per position so all
+# rosters fit in memory.
+#   python frontier_check.py                  synthetic leagues from benchmark.synthetic_tables
+#   python frontier_check.py --season 2024    the real tables of a season
+import argparse
+import itertools
+import sys
+import numpy as np
+from assumptions import team_composition
+from benchmark import synthetic_tables
+from data_store import load_table, player_key
+from derived import par_table
+from draft_engine import DRAFT_POSITIONS
+from efficient_frontier import mean_variance_frontier, roster_shapes
+from replacement import replacement_stats, par
+from score_matrix import ScoreTensor
+
+COMPOSITIONS = {
+    'standard': team_composition,
+    'superflex': {**team_composition, 'SFLEX': 1}
+}
+
+# every roster of composition from the depth best players by par at each position, as
+# (rosters, players) keys with their season points and variance of weekly totals
+def all_rosters(par_data, tensor, season, composition, depth):
+    par_data = par_data[(par_data['season'] == season) & par_data['position'].isin(DRAFT_POSITIONS)]
+    key = player_key(par_data)
+    par_data = par_data.sort_values(by='par', ascending=False).drop_duplicates(key)
+    pools = [par_data[par_data['position'] == pos][key].to_numpy()[:depth] for pos in DRAFT_POSITIONS]
+    rosters = []
+    for shape in roster_shapes(composition):
+        picks = [itertools.combinations(pool, k) for pool, k in zip(pools, shape)]
+        rosters += [sum(team, ()) for team in itertools.product(*picks)]
+    rosters = np.array(rosters)
+    totals = tensor.season(season)[:, tensor.slots(rosters.ravel()).reshape(rosters.shape)].sum(axis=2)
+    return rosters, totals.sum(axis=0), totals.var(axis=0, ddof=1)
+
+# rosters no other roster matches or beats on points while having at most its variance
+def brute_force_front(points, variances):
+    order = sorted(range(len(points)), key=lambda r: (-points[r], variances[r]))
+    front, best = [], np.inf
+    for r in order:
+        if variances[r] < best:
+            front.append(r)
+            best = variances[r]
+    return front
+
+# differences between the frontier and the brute-force front, empty when they agree
+def check(par_data, tensor, season, composition, depth):
+    rosters, points, variances = all_rosters(par_data, tensor, season, composition, depth)
+    expected = {tuple(sorted(rosters[r].tolist())): (points[r], variances[r]) for r in brute_force_front(points, variances)}
+    frontier = mean_variance_frontier(par_data, tensor, season, composition, depth=depth)
+    found = {tuple(sorted(np.asarray(team).tolist())): (p, v) for team, p, v in zip(frontier['players'], frontier['points'], frontier['variance'])}
+    problems = [f'missing {team}' for team in expected.keys() - found.keys()]
+    problems += [f'not Pareto-optimal {team}' for team in found.keys() - expected.keys()]
+    for team in expected.keys() & found.keys():
+        if not np.allclose(expected[team], found[team]):
+            problems.append(f'{team}: {found[team]} instead of {expected[team]}')
+    return len(rosters), len(expected), problems
+
+def synthetic_par(players, seasons, weeks):
+    identity, weekly, yearly, overall = synthetic_tables(players, seasons, weeks)
+    players = overall.merge(identity.drop(columns='player_id'), on='player_code', how='left')
+    return par(players, replacement_stats(players)), weekly
+
+def main():
+    parser = argparse.ArgumentParser(description='Check mean_variance_frontier against a brute-force search')
+    parser.add_argument('--season', type=int, default=None, help='check the real tables of this season')
+    parser.add_argument('--depth', type=int, default=6)
+    parser.add_argument('--leagues', type=int, default=3, help='synthetic leagues to check')
+    # read by profiling when it is imported
+    parser.add_argument('--profile', action='store_true', help='print per-stage time and memory at exit')
+    args = parser.parse_args()
+    if args.season is None:
+        leagues = [synthetic_par(300 + 50 * i, 1, 17) for i in range(args.leagues)]
+    else:
+        leagues = [(par_table([args.season]), load_table('weekly', [args.season]))]
+    failed = False
+    for i, (par_data, weekly) in enumerate(leagues):
+        tensor = ScoreTensor(weekly)
+        season = int(weekly['season'].max())
+        for name, composition in COMPOSITIONS.items():
+            n_rosters, n_front, problems = check(par_data, tensor, season, composition, args.depth)
+            status = 'ok' if not problems else 'FAILED'
+            print(f'league {i} {name:<10} {n_rosters:>8} rosters {n_front:>4} on the front  {status}')
+            for problem in problems:
+                print(f'  {problem}')
+            failed |= bool(problems)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Head-to-head schedules, standings and playoffs for simulated leagues
+# all_play_wins measures a roster against the whole league every week, real leagues play one
+# opponent a week. Here every league is replayed under many random round-robin schedules at once:
+# weekly scores are (..., weeks, teams) and every result gains a schedules axis before teams, so
+# the gap between head-to-head wins and all-play expected wins is the schedule luck.
+import numpy as np
+from batch_sim import all_play_wins
+
+# Round-robin rounds by the circle method: (teams - 1, teams) opponent of every team each round
+def round_robin(teams):
+    if teams % 2:
+        raise ValueError('Head-to-head schedules need an even number of teams')
+    circle = np.arange(teams)
+    rounds = np.zeros((teams - 1, teams), dtype=np.int64)
+    for r in range(teams - 1):
+        home, away = circle[:teams // 2], circle[teams // 2:][::-1]
+        rounds[r, home] = away
+        rounds[r, away] = home
+        # keep team 0 fixed and rotate everyone else
+        circle = np.concatenate([circle[:1], np.roll(circle[1:], 1)])
+    return rounds
+
+# n random schedules of weeks games: (n, weeks, teams) opponents
+# Each schedule relabels the teams and shuffles the round order, cycling through the rounds
+# again when the season is longer than one round robin.
+def schedules(teams, weeks, n, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    base = round_robin(teams)
+    rounds = np.argsort(rng.random((n, len(base))), axis=1)
+    rounds = np.resize(rounds.T, (weeks, n)).T
+    labels = np.argsort(rng.random((n, teams)), axis=1)
+    # team labels[s, t] plays labels[s, base[r, t]] in round r of schedule s
+    games = base[rounds]
+    opponents = np.zeros_like(games)
+    np.put_along_axis(opponents, labels[:, None, :], np.take_along_axis(labels[:, None, :], games, axis=2), axis=2)
+    return opponents
+
+# Head-to-head wins (..., schedules, teams), ties count half
+# weekly is (..., weeks, teams), opponents (schedules, weeks, teams) from schedules
+# Leagues and schedules are paired up chunk (league, schedule) pairs at a time, like the league
+# chunks of batch_sim, so the opponent scores never exist for all of them at once.
+def h2h_wins(weekly, opponents, chunk=4096):
+    n_weeks, n_teams = weekly.shape[-2:]
+    leagues = weekly.reshape(-1, n_weeks, n_teams)
+    per_block = min(len(opponents), chunk)
+    league_block = max(1, chunk // per_block)
+    wins = np.zeros((len(leagues), len(opponents), n_teams))
+    for l in range(0, len(leagues), league_block):
+        block = leagues[l:l + league_block, None]
+        for s in range(0, len(opponents), per_block):
+            part = opponents[s:s + per_block]
+            scores = np.broadcast_to(block, (len(block),) + part.shape)
+            against = np.take_along_axis(scores, np.broadcast_to(part, scores.shape), axis=-1)
+            wins[l:l + league_block, s:s + per_block] = (scores > against).sum(axis=-2) + 0.5 * (scores == against).sum(axis=-2)
+    return wins.reshape(weekly.shape[:-2] + wins.shape[1:])
+
+# Teams ordered by seed (..., schedules, teams), best first
+# Ties on wins go to points for and then to a coin flip.
+def seed_order(wins, points_for, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    points_for = np.broadcast_to(points_for[..., None, :], wins.shape)
+    return np.lexsort((rng.random(wins.shape), points_for, wins), axis=-1)[..., ::-1]
+
+# Single elimination bracket re-seeded every round, the top seeds get byes up to a power of two
+# weekly holds one week per playoff round (..., rounds, teams) and the higher seed wins ties.
+# Returns the champion of every schedule (..., schedules).
+def playoffs(weekly, order, playoff_teams=6):
+    rounds = int(np.ceil(np.log2(playoff_teams)))
+    byes = 2**rounds - playoff_teams
+    seed = np.argsort(order, axis=-1)
+    alive = order[..., :playoff_teams]
+    for r in range(rounds):
+        scores = np.broadcast_to(weekly[..., None, r, :], order.shape)
+        playing = alive[..., byes:]
+        half = playing.shape[-1] // 2
+        high, low = playing[..., :half], playing[..., ::-1][..., :half]
+        high_score = np.take_along_axis(scores, high, axis=-1)
+        low_score = np.take_along_axis(scores, low, axis=-1)
+        winners = np.where(high_score >= low_score, high, low)
+        alive = np.concatenate([alive[..., :byes], winners], axis=-1)
+        alive = np.take_along_axis(alive, np.argsort(np.take_along_axis(seed, alive, axis=-1), axis=-1), axis=-1)
+        byes = 0
+    return alive[..., 0]
+
+# Replay one or many leagues under n_schedules random schedules
+# weekly is (..., weeks, teams) weekly scores, e.g. simulate_leagues(...)['weekly']; the last
+# log2(playoff_teams) weeks are the playoffs unless regular_weeks says otherwise.
+# Returns head-to-head wins, all-play expected wins and seeds (1 = best) per schedule, the
+# champion per schedule, and playoff and title odds per team.
+def simulate_h2h(weekly, n_schedules=1000, playoff_teams=6, regular_weeks=None, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    weekly = np.asarray(weekly, dtype=float)
+    n_weeks, n_teams = weekly.shape[-2:]
+    rounds = int(np.ceil(np.log2(playoff_teams)))
+    regular_weeks = regular_weeks if regular_weeks is not None else n_weeks - rounds
+    if playoff_teams > n_teams or regular_weeks + rounds > n_weeks:
+        raise ValueError(f'{n_weeks} weeks cannot fit {regular_weeks} regular season weeks and {rounds} playoff rounds for {n_teams} teams')
+    regular = weekly[..., :regular_weeks, :]
+    opponents = schedules(n_teams, regular_weeks, n_schedules, rng)
+    wins = h2h_wins(regular, opponents)
+    order = seed_order(wins, regular.sum(axis=-2), rng)
+    champion = playoffs(weekly[..., regular_weeks:regular_weeks + rounds, :], order, playoff_teams)
+    seed = np.argsort(order, axis=-1) + 1
+    return {
+        'wins': wins,
+        'expected_wins': all_play_wins(regular) / (n_teams - 1),
+        'seed': seed,
+        'champion': champion,
+        'playoff_odds': (seed <= playoff_teams).mean(axis=-2),
+        'title_odds': (champion[..., None] == np.arange(n_teams)).mean(axis=-2)
+    }
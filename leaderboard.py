@@ -0,0 +1,83 @@
+# Sorted leaderboards of a value within groups, e.g. ppg per (season, position)
+# The rows are sorted once by group and value, best first, so the top k of a group is a slice,
+# the k-th best value and the rank of a row are lookups and the rank of any value is a binary
+# search. trim_players, replacement levels, PAR ordering, trivia and find_non_maximal_team all
+# read from one of these instead of sorting or ranking their DataFrame again, and
+# derived.leaderboard memoizes one per (table, value, groups) so they can share it.
+import numpy as np
+import pandas as pd
+
+
+class Leaderboard:
+    def __init__(self, data, value, groups=()):
+        self.data = data
+        self.value = value
+        self.groups = list(groups)
+        values = data[value].to_numpy(dtype=float)
+        if self.groups:
+            codes = data.groupby(self.groups, observed=True, sort=True).ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        else:
+            codes = np.zeros(len(data), dtype=np.int64)
+        # rows by group, then value from best to worst; NaN values sort last within their group and
+        # rows with a missing group key are left out of every group
+        order = np.lexsort((-values, codes))
+        self.missing = order[codes[order] < 0]
+        self.order = order[codes[order] >= 0]
+        self.values = values[self.order]
+        sorted_codes = codes[self.order]
+        n_groups = int(codes.max(initial=-1)) + 1
+        self.starts = np.searchsorted(sorted_codes, np.arange(n_groups))
+        self.counts = np.bincount(sorted_codes[~np.isnan(self.values)], minlength=n_groups)
+        self.keys = data[self.groups].iloc[self.order[self.starts]].reset_index(drop=True)
+        if len(self.groups) == 1:
+            self.lookup = {key: i for i, key in enumerate(self.keys[self.groups[0]])}
+        else:
+            self.lookup = {key: i for i, key in enumerate(self.keys.itertuples(index=False, name=None))}
+        # 1 for the best row of every group, NaN for rows without a value or group
+        self.rank = np.full(len(data), np.nan)
+        within = np.arange(len(self.order)) - self.starts[sorted_codes] + 1
+        self.rank[self.order] = np.where(np.isnan(self.values), np.nan, within)
+
+    # group number of a key, a value or tuple of values in the order of groups, () when ungrouped
+    def group(self, key=()):
+        if not self.groups:
+            return 0
+        return self.lookup[key]
+
+    # rows of the k best values of a group, best first; no rows for a key that is not there
+    def top(self, k, key=()):
+        if self.groups and key not in self.lookup:
+            return self.data.iloc[:0]
+        g = self.group(key)
+        return self.data.iloc[self.order[self.starts[g]:self.starts[g] + min(k, self.counts[g])]]
+
+    # k-th best value (1 is the best) of one group, or of groups, an array of group numbers
+    # k broadcasts against groups; default is returned where a group has fewer than k values
+    def kth(self, k, key=(), groups=None, default=np.nan):
+        groups = np.asarray(self.group(key) if groups is None else groups)
+        k = np.asarray(k)
+        valid = (k >= 1) & (k <= self.counts[groups])
+        position = self.starts[groups] + k - 1
+        values = np.full(valid.shape, default, dtype=float)
+        values[valid] = self.values[position[valid]]
+        return values if values.ndim else values.item()
+
+    # rank of every row within its group as a Series on the index of data, ties in row order
+    # like rank(method='first', ascending=False)
+    def ranks(self):
+        return pd.Series(self.rank, index=self.data.index)
+
+    # rank a value would have within a group: 1 + the number of values strictly better
+    def rank_of(self, value, key=()):
+        g = self.group(key)
+        best = -self.values[self.starts[g]:self.starts[g] + self.counts[g]]
+        return int(np.searchsorted(best, -value, side='left')) + 1
+
+    # every row in leaderboard order; ascending=False lists the groups from the last key down
+    def table(self, ascending=True):
+        if ascending:
+            order = self.order
+        else:
+            stops = np.r_[self.starts[1:], len(self.order)]
+            order = np.concatenate([self.order[a:b] for a, b in zip(self.starts[::-1], stops[::-1])] + [np.arange(0)])
+        return self.data.iloc[np.concatenate([order, self.missing]).astype(np.int64)]
@@ -0,0 +1,141 @@
+# Weekly start/sit: the best legal starting lineup of every roster in every week
+# Starting slots come from team_composition. Fixed positions are filled first, then FLEX and then
+# SFLEX from the players left over; since every flexible slot accepts a superset of the positions
+# before it, filling each slot group with its best eligible players gives the optimal lineup.
+# Rosters are laid out by position once, since they do not change from week to week, and every
+# slot group is then filled for all weeks, teams and leagues at once with elementwise max/min over
+# whole arrays. Positions are small integer codes into LINEUP_POSITIONS, code 0 is a player
+# without a position and never starts.
+import numpy as np
+import pandas as pd
+from assumptions import team_composition, flex_positions
+from draft_engine import DRAFT_POSITIONS
+
+LINEUP_POSITIONS = ['', 'QB', 'RB', 'WR', 'TE', 'K', 'DST']
+
+# Draft limits per position for a roster with a bench, e.g. RB 5 for RB 2 and FLEX 1 at depth 2
+# Every starting spot at a position is drafted depth times, plus one for each flexible slot it
+# can fill, like last_pos doubling the starters for the bench.
+def roster_limits(composition=team_composition, depth=2):
+    limits = {pos: composition.get(pos, 0) * depth for pos in DRAFT_POSITIONS}
+    for slot, eligible in flex_positions.items():
+        for pos in eligible:
+            limits[pos] += composition.get(slot, 0)
+    return limits
+
+# position names -> codes, unknown positions get 0
+def position_codes(positions):
+    codes = pd.Index(LINEUP_POSITIONS).get_indexer(np.asarray(positions, dtype=object).ravel())
+    return np.maximum(codes, 0).astype(np.int8).reshape(np.shape(positions))
+
+# position code of every tensor slot, 0 for players without one and the empty slot
+def slot_positions(tensor, identity):
+    positions = identity.drop_duplicates(tensor.key).set_index(tensor.key)['position'].astype(object)
+    return np.append(position_codes(positions.reindex(tensor.players).fillna('')), np.int8(0))
+
+# Slot groups in the order they are filled, (position codes, starters, flexible): the fixed
+# positions, then FLEX and SFLEX
+def lineup_groups(composition=team_composition):
+    groups = [([pos], n, False) for pos, n in composition.items() if pos not in flex_positions]
+    groups += [(flex_positions[slot], composition.get(slot, 0), True) for slot in flex_positions]
+    return [([LINEUP_POSITIONS.index(pos) for pos in eligible if pos in LINEUP_POSITIONS], n, flexible)
+            for eligible, n, flexible in groups if n > 0]
+
+# Roster laid out by position: (rows, ...) entries of roster (..., roster size), where every
+# position that can start gets as many rows as the most players any roster has there, padded with
+# pad. codes are the position codes of the roster entries. Returns the rows and the row range of
+# every position code.
+def lineup_rows(roster, codes, pad, composition=team_composition):
+    roster = np.asarray(roster)
+    codes = np.broadcast_to(codes, roster.shape)
+    rows, ranges, start = [], {}, 0
+    for eligible, _, _ in lineup_groups(composition):
+        for code in eligible:
+            is_code = codes == code
+            size = int(is_code.sum(axis=-1).max(initial=0))
+            if code in ranges or size == 0:
+                continue
+            # the roster entries at the position first, in roster order
+            idx = np.argsort(~is_code, axis=-1, kind='stable')[..., :size]
+            rows.append(np.where(np.take_along_axis(is_code, idx, axis=-1), np.take_along_axis(roster, idx, axis=-1), pad))
+            ranges[code] = (start, start + size)
+            start += size
+    rows = np.concatenate(rows, axis=-1) if rows else np.full(roster.shape[:-1] + (0,), pad, dtype=roster.dtype)
+    return np.moveaxis(rows, -1, 0), ranges
+
+# Insert a player into best, a list of arrays sorted best first, keeping at most size of them
+# Without values the points rank the players, with values the points follow the values around.
+def _insert(best, size, point, value=None):
+    for i, (best_point, best_value) in enumerate(best):
+        if value is None:
+            best[i], point = (np.maximum(best_point, point), None), np.minimum(best_point, point)
+        else:
+            better = value > best_value
+            best[i] = (np.where(better, point, best_point), np.where(better, value, best_value))
+            point, value = np.where(better, best_point, point), np.where(better, best_value, value)
+    if len(best) < size:
+        best.append((point, value))
+
+# Points of the best legal lineup (...) from points laid out by lineup_rows (rows, ...)
+# values, laid out the same way, pick the lineup instead of the points; padding rows score 0
+# points and, with values, must have -inf values. Every slot group keeps a running top list of its
+# starters plus as many players as the flexible slots after it can still take, with elementwise
+# max/min over whole (weeks, teams) arrays instead of a sort per roster. The players a group
+# passes over flow into the next flexible slot, which accepts a superset of its positions.
+def best_lineups(points, ranges, composition=team_composition, values=None):
+    groups = lineup_groups(composition)
+    total = np.zeros(points.shape[1:])
+    # players passed over that a later flexible slot may still start, per position code and under
+    # 'flex' for the last flexible slot
+    left, seen = {}, set()
+    for g, (eligible, n, flexible) in enumerate(groups):
+        size = n + sum(k for later, k, _ in groups[g + 1:] if set(eligible) & set(later))
+        best = []
+        candidates = [left.pop('flex')] if flexible and 'flex' in left else []
+        for code in eligible:
+            if code in left:
+                candidates.append(left.pop(code))
+            elif code in ranges and code not in seen:
+                candidates.append([(points[r], None if values is None else values[r]) for r in range(*ranges[code])])
+            seen.add(code)
+        for players in candidates:
+            for point, value in players:
+                _insert(best, size, point, value)
+        for point, _ in best[:n]:
+            total += point
+        left['flex' if flexible else eligible[0]] = best[n:]
+    return total
+
+# Points of the starting lineup (...) from points (..., roster)
+# projections picks the lineup instead of the actual points, for start/sit decisions made
+# before the games; it must broadcast to points.
+def lineup_points(points, codes, composition=team_composition, projections=None):
+    points = np.asarray(points, dtype=float)
+    size = points.shape[-1]
+    rows, ranges = lineup_rows(np.broadcast_to(np.arange(size), np.shape(codes)), codes, size, composition)
+    # one padding column past the roster that scores 0
+    def laid_out(array, pad):
+        array = np.concatenate([array, np.full(array.shape[:-1] + (1,), pad)], axis=-1)
+        idx = np.moveaxis(rows, 0, -1)
+        idx = np.broadcast_to(idx, array.shape[:-1] + idx.shape[-1:])
+        return np.moveaxis(np.take_along_axis(array, idx, axis=-1), -1, 0)
+    values = None if projections is None else laid_out(np.broadcast_to(projections, points.shape).astype(float), -np.inf)
+    return best_lineups(laid_out(points, 0), ranges, composition, values)
+
+# (rows, ...) projections of lineup_rows of tensor slots, the empty slot never starts
+def slot_values(projections, rows, empty):
+    values = np.array(projections, dtype=float)
+    values[empty] = -np.inf
+    return values[rows]
+
+# Weekly lineup scores (weeks, teams) for rosters of player ids in one season
+# same frame layout as sim_season
+# codes is the slot_positions array of the tensor
+def season_lineups(tensor, rosters, season, codes, composition=team_composition, projections=None):
+    slots = tensor.roster_slots(rosters) if not isinstance(rosters, np.ndarray) else rosters
+    rows, ranges = lineup_rows(slots, codes[slots], tensor.empty, composition)
+    values = None if projections is None else slot_values(projections, rows, tensor.empty)
+    scores = best_lineups(np.moveaxis(tensor.season(season)[:, rows], 1, 0), ranges, composition, values)
+    teams = pd.DataFrame(scores, columns=[f'{i}' for i in range(scores.shape[1])])
+    teams.index = pd.Index(tensor.weeks[season], name='week')
+    return teams
@@ -0,0 +1,112 @@
+# Parallel, reproducibly seeded Monte Carlo runner for draft + season experiments
+# Trials are cut into fixed-size chunks and chunk i always draws from the i-th child of
+# SeedSequence(seed), so results depend only on the seed and chunk size, never on the number
+# of workers. The score tensor is saved once and memory-mapped by every worker, and each chunk
+# is written to its own file as soon as it finishes so an interrupted run can be resumed.
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from assumptions import TEAMS
+from batch_sim import simulate_leagues
+from data_store import load_table, player_key
+from derived import par_table
+from draft_engine import noisy_drafts
+from score_matrix import ScoreTensor, saved_tensor, weekly_hash
+
+CHUNK = 1000
+
+# per-process state set up once by _init_worker
+_state = {}
+
+def _init_worker(tensor_dir, par_data):
+    _state['tensor'] = ScoreTensor.load(tensor_dir)
+    _state['par'] = par_data
+
+def chunk_path(out_dir, index):
+    return os.path.join(out_dir, f'chunk_{index:06d}.npz')
+
+# run one chunk of trials and write it to disk
+def run_chunk(index, trials, seed_seq, out_dir, settings):
+    tensor, par_data = _state['tensor'], _state['par']
+    rng = np.random.default_rng(seed_seq)
+    seasons = rng.choice(settings['seasons'], size=trials)
+    slots = np.zeros((trials, settings['teams'], 0), dtype=np.int64)
+    for season in np.unique(seasons):
+        trial = np.flatnonzero(seasons == season)
+        drafts = noisy_drafts(par_data, settings['teams'], len(trial), season=season, noise=settings['noise'], rng=rng)
+        if slots.shape[2] == 0:
+            slots = np.zeros((trials,) + drafts.shape[1:], dtype=np.int64)
+        slots[trial] = tensor.slots(drafts.ravel()).reshape(drafts.shape)
+    results = simulate_leagues(tensor, slots, seasons)
+    # write to a temporary file first so a killed run never leaves a partial chunk behind
+    path = chunk_path(out_dir, index)
+    np.savez(path + '.tmp.npz', season=seasons, slots=slots, points=results['points'],
+             variance=results['variance'], wins=results['wins'])
+    os.replace(path + '.tmp.npz', path)
+    return index
+
+# Run n_trials snake drafts + seasons into out_dir
+# par_data is the par table of draftable players, weekly the weekly stats of those seasons.
+# Chunks already on disk are skipped, so calling this again with the same settings resumes.
+def run_trials(out_dir, par_data, weekly, n_trials, seasons, seed=0, teams=TEAMS, noise=4, workers=None, chunk=CHUNK):
+    os.makedirs(out_dir, exist_ok=True)
+    weekly = weekly[weekly['season'].isin(seasons)]
+    settings = {'seasons': [int(s) for s in seasons], 'teams': teams, 'noise': noise,
+                'seed': seed, 'chunk': chunk, 'trials': n_trials, 'weekly': weekly_hash(weekly)}
+    settings_path = os.path.join(out_dir, 'settings.json')
+    if os.path.exists(settings_path):
+        with open(settings_path) as f:
+            saved = json.load(f)
+        if saved != settings:
+            raise ValueError(f'{out_dir} holds a run with different settings: {saved}')
+    with open(settings_path, 'w') as f:
+        json.dump(settings, f)
+    tensor_dir = saved_tensor(out_dir, weekly)
+    par_data = par_data[par_data['season'].isin(settings['seasons'])][[player_key(par_data), 'season', 'position', 'par']]
+    n_chunks = -(-n_trials // chunk)
+    children = np.random.SeedSequence(seed).spawn(n_chunks)
+    todo = [i for i in range(n_chunks) if not os.path.exists(chunk_path(out_dir, i))]
+    sizes = {i: min(chunk, n_trials - i * chunk) for i in todo}
+    if workers == 1:
+        _init_worker(tensor_dir, par_data)
+        for i in todo:
+            run_chunk(i, sizes[i], children[i], out_dir, settings)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(tensor_dir, par_data)) as pool:
+            futures = [pool.submit(run_chunk, i, sizes[i], children[i], out_dir, settings) for i in todo]
+            for future in as_completed(futures):
+                future.result()
+    return load_results(out_dir)
+
+# one row per (trial, team) from every finished chunk
+def load_results(out_dir):
+    with open(os.path.join(out_dir, 'settings.json')) as f:
+        size = json.load(f)['chunk']
+    frames = []
+    for path in sorted(glob.glob(os.path.join(out_dir, 'chunk_*[0-9].npz'))):
+        index = int(os.path.basename(path)[6:12])
+        with np.load(path) as chunk:
+            trials, teams = chunk['points'].shape
+            frames.append(pd.DataFrame({
+                'trial': np.repeat(index * size + np.arange(trials), teams),
+                'season': np.repeat(chunk['season'], teams),
+                'team': np.tile(np.arange(teams), trials),
+                'points': chunk['points'].ravel(),
+                'variance': chunk['variance'].ravel(),
+                'wins': chunk['wins'].ravel()
+            }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def main():
+    SZN = [2019,2020,2021,2022,2023,2024]
+    weekly = load_table('weekly', SZN)
+    par_results = par_table(SZN)
+    par_results = par_results[par_results['position'].isin(['QB','RB','WR','TE'])]
+    outcomes = run_trials('data/monte_carlo', par_results, weekly, 1000000, SZN, seed=2024)
+    print(outcomes.groupby('team')[['points','wins']].mean())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# Running yearly/overall stats and covariances updated one NFL week at a time
+# OnlineStats keeps, per player-season, the count, mean and sum of squared deviations of weekly
+# points (Welford) next to the yearly sums, and per season the running sums and sums of products of
+# weekly points between players. Folding in a new week touches only the rows of the players in it;
+# yearly, overall, PAR and the season covariance are then read off the accumulators instead of
+# regrouping the whole weekly table.
+#   python online_stats.py    fold the unseen rows of the open seasons of weekly_stats into the saved
+#                             state and rewrite the yearly and overall rows of the seasons they belong to
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from assumptions import TEAMS, team_composition
+from create_base_tables import build_overall, replace_seasons, week_totals
+from data_store import DATA_DIR, csv_path, load_table, player_codes, player_key, stored_seasons, write_table
+from replacement import replacement_stats, par
+
+STATE_PATH = os.path.join(DATA_DIR, 'online_stats.pkl')
+# yearly columns summed over weeks, in yearly_stats order
+SUM_COLUMNS = ['passing_yards', 'passing_tds', 'interceptions', 'rushing_yards', 'rushing_tds',
+               'receptions', 'receiving_yards', 'receiving_tds', 'fantasy_points_ppr', 'fumbles', '2pt']
+POINTS = 'fantasy_points_ppr'
+
+# array grown to hold at least size rows, doubling so appends stay amortized O(1)
+def _grow(array, size):
+    if len(array) >= size:
+        return array
+    grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+# Merge two sets of (count, mean, squared deviations) with Chan's parallel update
+def merge_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = np.where(n > 0, n_b / n, 0)
+    mean = mean_a + delta * share
+    m2 = m2_a + m2_b + delta ** 2 * n_a * share
+    return n, mean, m2
+
+
+class OnlineStats:
+    def __init__(self):
+        # column players are keyed on, player_code or player_id, set by the first update
+        self.key = None
+        # (player, season) -> row of the accumulators
+        self.rows = {}
+        self.keys = []
+        self.sums = np.zeros((0, len(SUM_COLUMNS)))
+        self.weeks = np.zeros(0, dtype=np.int64)
+        self.seasons = np.zeros(0, dtype=np.int64)
+        self.moments = np.zeros((0, 3))
+        self.teams = np.empty(0, dtype=object)
+        # season -> weekly point sums and sums of products between every pair of players
+        self.pairs = {}
+        # (season, week) -> points of every player folded in for that week
+        self.folded = {}
+        self.changed = set()
+
+    @classmethod
+    def from_weekly(cls, weekly):
+        stats = cls()
+        stats.update(weekly)
+        return stats
+
+    # the accumulators grow by doubling, only their used rows are pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        size = len(self.keys)
+        for name in ['sums', 'weeks', 'seasons', 'moments', 'teams']:
+            state[name] = state[name][:size].copy()
+        state['pairs'] = {}
+        for season, pairs in self.pairs.items():
+            size = len(pairs['players'])
+            state['pairs'][season] = {**pairs, 'sums': pairs['sums'][:size].copy(), 'scored': pairs['scored'][:size].copy(),
+                                      'products': pairs['products'][:size, :size].copy()}
+        return state
+
+    def save(self, path=STATE_PATH):
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    # rows of the accumulators for keys, new keys get fresh zeroed rows
+    def _rows(self, keys):
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = len(self.keys)
+                self.keys.append(key)
+            rows[i] = row
+        size = len(self.keys)
+        self.sums = _grow(self.sums, size)
+        self.weeks = _grow(self.weeks, size)
+        self.seasons = _grow(self.seasons, size)
+        self.seasons[rows] = [season for _, season in keys]
+        self.moments = _grow(self.moments, size)
+        if len(self.teams) < size:
+            teams = np.empty(len(self.sums), dtype=object)
+            teams[:len(self.teams)] = self.teams
+            self.teams = teams
+        return rows
+
+    # Fold weekly_stats rows into the accumulators
+    # Player-weeks are the unit of update: rows of a (season, week, player) that was folded in
+    # before are skipped, so a week can be folded while its games are still being played and the
+    # whole weekly table can be passed every time. Stat corrections to a folded row need a fresh
+    # from_weekly. Returns the seasons that changed, also kept in self.changed.
+    def update(self, weekly):
+        self.key = self.key or player_key(weekly)
+        weekly = weekly.dropna(subset=[self.key])
+        if self.key == 'player_code':
+            weekly = weekly[weekly['player_code'] >= 0]
+        weekly = weekly[~self._folded_rows(weekly)]
+        self.changed = set(weekly['season'].astype(np.int64).unique().tolist())
+        if weekly.empty:
+            return self.changed
+        grouped = weekly.groupby([self.key, 'season'], sort=False)
+        chunk = grouped[SUM_COLUMNS].sum()
+        points = grouped[POINTS]
+        keys = [(player, int(season)) for player, season in chunk.index]
+        rows = self._rows(keys)
+        self.sums[rows] += chunk.to_numpy(dtype=float)
+        self.weeks[rows] += grouped['week'].count().to_numpy()
+        n_b = points.count().to_numpy(dtype=float)
+        mean_b = points.mean().fillna(0).to_numpy()
+        m2_b = (points.var(ddof=0).fillna(0) * n_b).to_numpy()
+        n, mean, m2 = merge_moments(*self.moments[rows].T, n_b, mean_b, m2_b)
+        self.moments[rows] = np.column_stack([n, mean, m2])
+        # recent_team is the first team a player-season was seen with
+        first = grouped['recent_team'].first().to_numpy()
+        unset = pd.isna(self.teams[rows])
+        self.teams[rows[unset]] = first[unset]
+        for (season, week), rows_week in weekly.groupby(['season', 'week']):
+            self._add_week(int(season), int(week), rows_week)
+        return self.changed
+
+    # mask of the rows of weekly whose (season, week, player) was folded in before
+    def _folded_rows(self, weekly):
+        folded = np.zeros(len(weekly), dtype=bool)
+        players = weekly[self.key].to_numpy()
+        for (season, week), at in weekly.groupby(['season', 'week']).indices.items():
+            points = self.folded.get((int(season), int(week)))
+            if points is not None:
+                folded[at] = np.isin(players[at], points.index)
+        return folded
+
+    # sums and sums of products of one week of points, only the players in the week are touched
+    # A week folded before is refolded: its old products are taken out and the whole week, old
+    # and new players together, is put back so the pairs between them are counted too.
+    def _add_week(self, season, week, weekly):
+        pairs = self.pairs.setdefault(season, {'index': {}, 'players': [], 'weeks': 0,
+                                               'sums': np.zeros(0), 'products': np.zeros((0, 0)), 'scored': np.zeros(0, dtype=bool)})
+        x = weekly.groupby(self.key)[POINTS].sum()
+        old = self.folded.get((season, week))
+        if old is None:
+            pairs['weeks'] += 1
+        else:
+            i = np.array([pairs['index'][player] for player in old.index])
+            values = old.to_numpy(dtype=float)
+            pairs['sums'][i] -= values
+            pairs['products'][np.ix_(i, i)] -= np.outer(values, values)
+            x = pd.concat([old, x])
+        self.folded[(season, week)] = x
+        index = pairs['index']
+        for player in x.index:
+            if player not in index:
+                index[player] = len(pairs['players'])
+                pairs['players'].append(player)
+        size = len(pairs['players'])
+        if size > len(pairs['sums']):
+            capacity = max(size, 2 * len(pairs['sums']))
+            products = np.zeros((capacity, capacity))
+            products[:len(pairs['sums']), :len(pairs['sums'])] = pairs['products']
+            pairs['products'] = products
+            pairs['sums'] = _grow(pairs['sums'], capacity)
+            pairs['scored'] = _grow(pairs['scored'], capacity)
+        i = np.array([index[player] for player in x.index])
+        values = x.to_numpy(dtype=float)
+        pairs['sums'][i] += values
+        pairs['products'][np.ix_(i, i)] += np.outer(values, values)
+        pairs['scored'][i] |= values != 0
+
+    # row positions of the player-seasons in seasons, all of them for None
+    def _select(self, seasons=None):
+        rows = np.arange(len(self.keys))
+        if seasons is not None:
+            rows = rows[np.isin(self.seasons[rows], list(seasons))]
+        return rows
+
+    # yearly_stats rows for seasons, the same columns and values as create_base_tables.build_yearly
+    def yearly(self, seasons=None):
+        rows = self._select(seasons)
+        keys = [self.keys[row] for row in rows]
+        yearly = pd.DataFrame(self.sums[rows], columns=SUM_COLUMNS)
+        yearly.insert(0, self.key, [player for player, _ in keys])
+        yearly.insert(1, 'season', self.seasons[rows])
+        yearly.insert(2, 'recent_team', self.teams[rows])
+        yearly.insert(3, 'week', self.weeks[rows])
+        yearly['week_total'] = week_totals(yearly)
+        n, _, m2 = self.moments[rows].T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            yearly['std_dev'] = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+        return yearly.sort_values(by=['season', self.key]).reset_index(drop=True)
+
+    # overall_stats rows for seasons
+    def overall(self, seasons=None):
+        return build_overall(self.yearly(seasons))
+
+    # PAR of the seasons touched by the last update, or of seasons
+    # Replacement levels are ranked within a season, so the other seasons of a PAR table stay valid.
+    def par(self, identity, seasons=None, teams=TEAMS, composition=team_composition):
+        seasons = self.changed if seasons is None else seasons
+        if self.key == 'player_id':
+            identity = identity.drop(columns='player_code', errors='ignore')
+        players = self.overall(seasons).merge(identity, on=self.key, how='left')
+        return par(players, replacement_stats(players, teams, composition))
+
+    # Covariance of weekly points between the players who scored in a season, like
+    # ScoreTensor.covariance: weeks nobody on a roster played count as 0 points.
+    # Returns (players, cov), or the tensor's (pool, cov) layout when a tensor is given; players
+    # the tensor does not know are left out.
+    def covariance(self, season, tensor=None):
+        pairs = self.pairs[season]
+        n = pairs['weeks']
+        scored = np.flatnonzero(pairs['scored'][:len(pairs['players'])])
+        players = np.array(pairs['players'])[scored]
+        if tensor is not None:
+            slots = tensor.slots(players)
+            known = slots != tensor.empty
+            order = np.argsort(slots[known], kind='stable')
+            scored, slots = scored[known][order], slots[known][order]
+        sums = pairs['sums'][scored]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = (pairs['products'][np.ix_(scored, scored)] - np.outer(sums, sums) / n) / (n - 1)
+        if tensor is None:
+            return players, cov
+        pool = np.full(tensor.empty + 1, len(scored))
+        pool[slots] = np.arange(len(scored))
+        padded = np.zeros((len(scored) + 1, len(scored) + 1))
+        padded[:-1, :-1] = cov
+        return pool, padded
+
+# Fold the unseen rows of the weekly table into the saved state and rewrite the yearly and
+# overall rows of the seasons they belong to
+# Only the open seasons are read from the store, the latest season folded in and the ones after
+# it, so an in-season run reads one season of weekly rows instead of the whole history.
+def main():
+    stats = OnlineStats.load() if os.path.exists(STATE_PATH) else OnlineStats()
+    seasons = stored_seasons('weekly')
+    if stats.folded:
+        latest = max(season for season, _ in stats.folded)
+        seasons = [season for season in seasons if season >= latest]
+    changed = stats.update(load_table('weekly', seasons))
+    if not changed:
+        print('No new weeks')
+        return
+    yearly = stats.yearly(changed)
+    if stats.key == 'player_code':
+        # the csv tables are keyed on player_id, codes turn back into ids here
+        yearly.insert(0, 'player_id', player_codes()[yearly['player_code'].to_numpy()])
+        yearly = yearly.drop(columns='player_code')
+    for table, data in [('yearly', yearly), ('overall', build_overall(yearly))]:
+        path = csv_path(table)
+        old = pd.read_csv(path) if os.path.exists(path) else None
+        data = replace_seasons(old, data, changed)
+        data.to_csv(path, index=False)
+        write_table(table, data)
+    stats.save()
+    print(f'Updated seasons {sorted(changed)}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Binned figures for large simulation outputs and batch figure export
+# Scatter plots of raw outcomes grow with the number of simulated teams: kaleido has to render
+# every marker and the HTML embeds every point. These helpers aggregate the outcomes into a fixed
+# grid of bins with numpy first, so a figure costs the same for a thousand or a billion points,
+# and export_figures writes a whole batch of figures through one renderer session.
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# most raw points a scatter plot is drawn with before switching to binned figures
+SCATTER_LIMIT = 5000
+
+# Count or mean of z in a bins x bins grid over x and y
+# Returns (grid (y bins, x bins), x bin centers, y bin centers), empty bins are NaN for means
+def bin2d(x, y, z=None, bins=100, ranges=None):
+    x, y = np.asarray(x, dtype=float).ravel(), np.asarray(y, dtype=float).ravel()
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=ranges)
+    if z is not None:
+        totals, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges], weights=np.asarray(z, dtype=float).ravel())
+        with np.errstate(invalid='ignore', divide='ignore'):
+            counts = np.where(counts > 0, totals / counts, np.nan)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    return counts.T, x_centers, y_centers
+
+# Heatmap of x against y, colored by the number of outcomes or the mean of color per bin
+def binned_scatter(data, x, y, color=None, bins=100, title=None):
+    z = None if color is None else data[color]
+    grid, xs, ys = bin2d(data[x], data[y], z, bins)
+    fig = go.Figure(go.Heatmap(x=xs, y=ys, z=grid, colorbar={'title': color or 'count'}))
+    fig.update_layout(xaxis_title=x, yaxis_title=y, title=title)
+    return fig
+
+# Surface of the mean of z over an x, y grid, the binned version of a 3D scatter
+def binned_surface(data, x, y, z, bins=50, title=None):
+    grid, xs, ys = bin2d(data[x], data[y], data[z], bins)
+    fig = go.Figure(go.Surface(x=xs, y=ys, z=grid))
+    fig.update_layout(scene={'xaxis_title': x, 'yaxis_title': y, 'zaxis_title': z}, title=title)
+    return fig
+
+# Percentile bands of weekly team scores across simulated leagues
+# weekly is (leagues, weeks, teams) from simulate_leagues; one median line and shaded band per team
+def season_bands(weekly, weeks=None, percentiles=(10, 50, 90), title='Fantasy Points per Week'):
+    weekly = np.asarray(weekly)
+    weeks = np.arange(1, weekly.shape[1] + 1) if weeks is None else np.asarray(weeks)
+    low, mid, high = np.percentile(weekly, percentiles, axis=0)
+    fig = go.Figure()
+    for team in range(weekly.shape[2]):
+        fig.add_trace(go.Scatter(x=np.concatenate([weeks, weeks[::-1]]), y=np.concatenate([high[:, team], low[::-1, team]]),
+                                 fill='toself', opacity=0.2, line={'width': 0}, showlegend=False, name=f'{team}'))
+        fig.add_trace(go.Scatter(x=weeks, y=mid[:, team], mode='lines', name=f'{team}'))
+    fig.update_layout(xaxis_title='week', yaxis_title='points', title=title)
+    return fig
+
+# Write a dict of path -> figure; every extension but .html is rendered by kaleido in a single
+# session. .html files are self-contained unless include_plotlyjs='cdn', which makes them much
+# smaller but needs network access to open.
+def export_figures(figures, include_plotlyjs=True):
+    images = {path: fig for path, fig in figures.items() if not path.endswith('.html')}
+    for path, fig in figures.items():
+        if path.endswith('.html'):
+            fig.write_html(path, include_plotlyjs=include_plotlyjs)
+    if not images:
+        return
+    if hasattr(pio, 'write_images'):
+        pio.write_images(list(images.values()), list(images))
+    else:
+        for path, fig in images.items():
+            fig.write_image(path)
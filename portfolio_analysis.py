@@ -1,98 +1,43 @@
 import pandas as pd
-from assumptions import last_pos, TEAMS, team_composition
+from data_store import load_table, player_key
+from derived import leaderboard, par_table
+from score_matrix import ScoreTensor
+from draft_engine import draft_table, pick_order
+from leaderboard import Leaderboard
+from assumptions import TEAMS, team_composition
+from profiling import profiled
 import plotly.express as px
-import time
+import numpy as np
 import itertools
-def load_data():
-    # Load the data from CSV files
-    identity = pd.read_csv('data/player_identity.csv')
-    weekly = pd.read_csv('data/weekly_stats.csv')
-    yearly = pd.read_csv('data/yearly_stats.csv')
-    overall = pd.read_csv('data/overall_stats.csv')
-    
-    return identity, weekly, yearly, overall
-
-# will return the ith largest value in a group, or 0 if there are not enough values
-def ith_largest_or_zero(group, i):
-    top_i = group.nlargest(i)
-    if len(top_i) < i:
-        return 0
-    return top_i.iloc[-1]
-
-
-# find stats for replacement player
-def replacement_stats(data):
-    replacement = {}
-    for pos in ['QB', 'RB', 'WR', 'TE', 'K']:
-        replacement[pos] = int(last_pos(pos))
-    return (data
-        .groupby(['season','position'])['ppg']
-        .apply(lambda x: ith_largest_or_zero(x, replacement[x.name[1]]))
-        .reset_index())
-
-# calculate points above replacement for each player
-def par(data, replacement):
-    data = data.merge(replacement, on=['season', 'position'], how='left', suffixes=('', '_replacement'))
-    data['par'] = data['ppg'] - data['ppg_replacement']
-    data = data.drop(columns=['ppg_replacement']) 
-    return data[['player_id', 'player_name','season', 'position', 'ppg', 'par']].sort_values(by=['season', 'par'], ascending=[False, False]).reset_index(drop=True)
-
 # Simulate a draft based on the points above replacement
 def sim_draft(teams,par_data,season=2024,turns=True):
-    team_counter = {'QB':0, 'RB':0, 'WR':0,'TE':0}
-    counters = []
-    rosters = []
     par_data = par_data[par_data['season'] == season].reset_index(drop=True)
-    for _ in range(teams):
-        counters.append(team_counter.copy())
-        rosters.append([])
-    rounds = team_composition['QB'] + team_composition['RB'] + team_composition['WR'] + team_composition['TE']
     if turns:
         # Team 0 is the greedy team; always gets to pick first and has perfect knowledge
-        for _ in range(rounds):
-            for team in range(teams):
-                # Find next best player
-                no_pick = True
-                pointer = 0
-                while no_pick:
-                    next_pick = par_data.iloc[pointer]
-                    if counters[team][next_pick['position']] < team_composition[next_pick['position']]:
-                        no_pick = False
-                        counters[team][next_pick['position']] += 1
-                        rosters[team].append(next_pick['player_id'])
-                        print(f"Team {team} picks {next_pick['player_name']}")
-                        par_data = par_data.drop(index=pointer)
-                        par_data = par_data.reset_index(drop=True)
-                    else:
-                        pointer += 1
+        style = 'linear'
     else:
         # Team 0 is the maximal team; has the best possible team composition for the year
-        for team in range(teams):
-            for _ in range(rounds):
-                # Find next best player
-                no_pick = True
-                pointer = 0
-                while no_pick:
-                    next_pick = par_data.iloc[pointer]
-                    if counters[team][next_pick['position']] < team_composition[next_pick['position']]:
-                        no_pick = False
-                        counters[team][next_pick['position']] += 1
-                        rosters[team].append(next_pick['player_id'])
-                        print(f"Team {team} picks {next_pick['player_name']}")
-                        par_data = par_data.drop(index=pointer)
-                        par_data = par_data.reset_index(drop=True)
-                    else:
-                        pointer += 1
+        style = 'sequential'
+    rosters = draft_table(teams, par_data, style=style)
+    names = par_data.set_index(player_key(par_data))['player_name']
+    rounds = len(rosters[0])
+    for pick, team in enumerate(pick_order(teams, rounds, style)):
+        r = pick // teams if turns else pick % rounds
+        print(f"Team {team} picks {names[rosters[team][r]]}")
     return rosters
 
 # returns the index of the team that won each week
-def sim_season(rosters, weekly,season=2024):
+# tensor is an optional ScoreTensor built from weekly, which skips the per-team filtering
+def sim_season(rosters, weekly,season=2024,tensor=None):
+    if tensor is not None:
+        return tensor.season_frame(rosters, season).reset_index()
+    key = player_key(weekly)
     weekly = weekly[weekly['season'] == season].reset_index(drop=True)
-    weekly = weekly[['player_id', 'week', 'fantasy_points_ppr']]
+    weekly = weekly[[key, 'week', 'fantasy_points_ppr']]
     team_num = 0
     teams = weekly[['week']].drop_duplicates().reset_index(drop=True)
     for team in rosters:
-        team_weekly = weekly[weekly['player_id'].isin(team)]
+        team_weekly = weekly[weekly[key].isin(team)]
         team_weekly = team_weekly.groupby('week')['fantasy_points_ppr'].sum().reset_index()
         team_weekly.rename(columns={'fantasy_points_ppr': f'{team_num}'}, inplace=True)
         teams = teams.merge(team_weekly, on='week', how='left')
@@ -102,26 +47,37 @@ def sim_season(rosters, weekly,season=2024):
 def find_winner(teams):
         return teams.groupby('week').apply(lambda x: x.idxmax(axis=1)).rename('winner').reset_index(drop=True)
 
+@profiled()
 def graph_season(teams):
     fig = px.line(teams,x='week', y=teams.columns[1:], title='Fantasy Points per Week')
     fig.write_image('figures/per_week.png')
 
-def find_non_maximal_team(maximal, par_data, weekly, season=2024):
+# the k best players by par at a position in a season, leaving out the players in exclude
+# board is a Leaderboard of par by (season, position) over the par table
+def top_available(board, k, season, position, exclude):
+    key = player_key(board.data)
+    top = board.top(k + len(exclude), (season, position))
+    return top[~top[key].isin(exclude)].head(k)
+
+# board is an optional Leaderboard of par by (season, position) over par_data, e.g. the shared
+# derived.leaderboard('par', 'par', ('season', 'position')); it is built here otherwise
+def find_non_maximal_team(maximal, par_data, weekly, season=2024, tensor=None, board=None):
     BENCHMARK = 5
     MULT = 2
+    key = player_key(par_data)
+    if board is None:
+        board = Leaderboard(par_data, 'par', ['season', 'position'])
     par_data = par_data[par_data['season'] == season].reset_index(drop=True)
-    # Remove the players on the maximal team
-    par_data = par_data[~par_data['player_id'].isin(maximal[0])].reset_index(drop=True)
-    # Separate out the positions
-    qb_data = par_data[par_data['position'] == 'QB'].nlargest(team_composition['QB']*MULT, 'par')
-    rb_data = par_data[par_data['position'] == 'RB'].nlargest(team_composition['RB']*MULT, 'par')
-    wr_data = par_data[par_data['position'] == 'WR'].nlargest(team_composition['WR']*MULT, 'par')
-    te_data = par_data[par_data['position'] == 'TE'].nlargest(team_composition['TE']*MULT, 'par')
+    # Separate out the positions, without the players on the maximal team
+    qb_data = top_available(board, team_composition['QB']*MULT, season, 'QB', maximal[0])
+    rb_data = top_available(board, team_composition['RB']*MULT, season, 'RB', maximal[0])
+    wr_data = top_available(board, team_composition['WR']*MULT, season, 'WR', maximal[0])
+    te_data = top_available(board, team_composition['TE']*MULT, season, 'TE', maximal[0])
     # Generate all combinations at each position
-    qb_combinations = [c for c in itertools.combinations(qb_data['player_id'], team_composition['QB'])]
-    rb_combinations = [c for c in itertools.combinations(rb_data['player_id'], team_composition['RB'])]
-    wr_combinations = [c for c in itertools.combinations(wr_data['player_id'], team_composition['WR'])]
-    te_combinations = [c for c in itertools.combinations(te_data['player_id'], team_composition['TE'])]
+    qb_combinations = [c for c in itertools.combinations(qb_data[key], team_composition['QB'])]
+    rb_combinations = [c for c in itertools.combinations(rb_data[key], team_composition['RB'])]
+    wr_combinations = [c for c in itertools.combinations(wr_data[key], team_composition['WR'])]
+    te_combinations = [c for c in itertools.combinations(te_data[key], team_composition['TE'])]
     # Form all possible teams
     all_teams = itertools.product(qb_combinations, rb_combinations, wr_combinations, te_combinations)
     # Sim season and find winners for each team
@@ -129,30 +85,71 @@ def find_non_maximal_team(maximal, par_data, weekly, season=2024):
         team = list(team)
         team = [item for sublist in team for item in sublist]
         competing_teams = [maximal[0],list(team)]
-        outcomes = sim_season(competing_teams, weekly, season)
+        outcomes = sim_season(competing_teams, weekly, season, tensor=tensor)
         winners = find_winner(outcomes)
         # Check if the non-maximal team wins at least BENCHMARK weeks
         wins = winners.value_counts().get(1, 0)
         if wins > BENCHMARK:
             print(wins)
-            print(par_data[par_data['player_id'].isin(list(team))]['player_name'].tolist())
+            print(par_data[par_data[key].isin(list(team))]['player_name'].tolist())
     return None
 
+# Array version of find_non_maximal_team that returns a ranked table instead of printing
+# Each position's candidate combinations become weekly score vectors and teams are built one
+# position at a time. A partial team is pruned as soon as adding the best remaining combination
+# every week still could not beat the maximal team in more than benchmark weeks.
+# composition sets the players per position, e.g. {'QB': 2, ...} for superflex style rosters.
+# board is an optional Leaderboard of par by (season, position) over par_data, as for find_non_maximal_team.
+def rank_non_maximal_teams(maximal, par_data, tensor, season=2024, benchmark=5, mult=2, composition=team_composition, board=None):
+    key = player_key(par_data)
+    if board is None:
+        board = Leaderboard(par_data, 'par', ['season', 'position'])
+    par_data = par_data[par_data['season'] == season].reset_index(drop=True)
+    matrix = tensor.season(season)
+    target = matrix[:, tensor.slots(maximal[0])].sum(axis=1)
+    # (combinations, players) ids and (combinations, weeks) scores for every position
+    levels = []
+    for pos in ['QB', 'RB', 'WR', 'TE']:
+        if composition.get(pos, 0) == 0:
+            continue
+        pool = top_available(board, composition[pos]*mult, season, pos, maximal[0])[key].to_numpy()
+        combos = np.array(list(itertools.combinations(range(len(pool)), composition[pos]))).reshape(-1, composition[pos])
+        levels.append((pool[combos], matrix[:, tensor.slots(pool)[combos]].sum(axis=2).T))
+    # best weekly score still reachable from the positions after each level
+    best = [weekly.max(axis=0) for _, weekly in levels]
+    bounds = [np.sum(best[i + 1:], axis=0) for i in range(len(levels))]
+    scores = np.zeros((1, len(target)))
+    choices = np.zeros((1, 0), dtype=np.int64)
+    for (_, weekly), bound in zip(levels, bounds):
+        parent = np.repeat(np.arange(len(scores)), len(weekly))
+        child = np.tile(np.arange(len(weekly)), len(scores))
+        scores = scores[parent] + weekly[child]
+        choices = np.column_stack([choices[parent], child])
+        keep = ((scores + bound) > target).sum(axis=1) > benchmark
+        scores, choices = scores[keep], choices[keep]
+    names = par_data.drop_duplicates(key).set_index(key)['player_name']
+    teams = np.hstack([np.zeros((len(choices), 0), dtype=object)] + [levels[i][0][choices[:, i]] for i in range(len(levels))])
+    team_names = names.reindex(teams.ravel()).to_numpy().reshape(teams.shape)
+    return (pd.DataFrame({
+        'players': teams.tolist(),
+        'player_names': team_names.tolist(),
+        'wins': (scores > target).sum(axis=1),
+        'points': scores.sum(axis=1)
+        })
+        .sort_values(by=['wins', 'points'], ascending=[False, False])
+        .reset_index(drop=True))
+
 def main():
-    identity, weekly, yearly, overall = load_data()
-    overall = overall.merge(identity, on='player_id', how='left')
-    # Calculate replacement stats
-    replacement = replacement_stats(overall)
-    
-    # Calculate points above replacement
-    par_results = par(overall, replacement)
+    weekly = load_table('weekly')
+    # Points above replacement, cached on disk
+    par_results = par_table()
+    board = leaderboard('par', 'par', ('season', 'position'))
     # Print results
-    file = open('data/points_above_replacement.csv', 'w')
-    file.write(par_results.to_csv(index=False))
-    file.close()
+    par_results.to_csv('data/points_above_replacement.csv', index=False)
     SZN = 2024
     maximal = sim_draft(1, par_results, season=SZN, turns=True)
-    find_non_maximal_team(maximal, par_results, weekly, season=SZN)
+    tensor = ScoreTensor(weekly)
+    print(rank_non_maximal_teams(maximal, par_results, tensor, season=SZN, board=board))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,56 +1,29 @@
+import hashlib
 import pandas as pd
+from cache import cached
+from data_store import player_key
+from derived import top_player_table
 from assumptions import last_pos, TEAMS, team_composition
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 import random
-import time
-import itertools
+import warnings
 
 pairs = ['QB-WR1','QB-RB1','QB-WR2','QB-RB2','RB1-RB2','WR1-WR2','QB-TE1']
 
-def load_data():
-    # Load the data from CSV files
-    identity = pd.read_csv('data/player_identity.csv')
-    weekly = pd.read_csv('data/weekly_stats.csv')
-    yearly = pd.read_csv('data/yearly_stats.csv')
-    overall = pd.read_csv('data/overall_stats.csv')
-    
-    return identity, weekly, yearly, overall
-
-# narrow down to WR1, WR2, TE1, RB1, RB2, QB1 and rename positions to match
-def trim_players(data):
-    data['rank'] = (data
-            .groupby(['season','position','recent_team'])['ppg']
-            .rank(method='first',ascending=False)
-            .astype('Int64'))
-    
-    data['position']= data['position'] + data['rank'].astype(str)
-    data.drop(columns='rank')
-    data = data[data.position.isin(['QB1','TE1','RB1','RB2','WR1','WR2'])]
-    return data
-
-# Group positions together
-def groups(yearly,weekly,identity,overall):
-    weekly = weekly[['player_id','week','fantasy_points_ppr','season']]
-    yearly = yearly[['player_id','season','recent_team']]
-    overall = overall[['player_id','ppg','season']]
-    #identify relevant players
-    data = yearly.merge(identity,on='player_id',how='left')
-    data = pd.merge(left=data,right=overall,how='left',right_on=['player_id','season'],left_on=['player_id','season'])
-    data = trim_players(data)
-    data = pd.merge(left=data,right=weekly,how='left',right_on=['player_id','season'],left_on=['player_id','season'])
-    return data
-
-
 # returns the index of the team that won each week
-def sim_season(rosters, weekly,season=2024):
+# tensor is an optional ScoreTensor built from weekly, which skips the per-team filtering
+def sim_season(rosters, weekly,season=2024,tensor=None):
+    if tensor is not None:
+        return tensor.season_frame(rosters, season)
+    key = player_key(weekly)
     weekly = weekly[weekly['season'] == season].reset_index(drop=True)
-    weekly = weekly[['player_id', 'week', 'fantasy_points_ppr']]
+    weekly = weekly[[key, 'week', 'fantasy_points_ppr']]
     team_num = 0
     teams = weekly[['week']].drop_duplicates().reset_index(drop=True)
     for team in rosters:
-        team_weekly = weekly[weekly['player_id'].isin(team)]
+        team_weekly = weekly[weekly[key].isin(team)]
         team_weekly = team_weekly.groupby('week')['fantasy_points_ppr'].sum().reset_index()
         team_weekly.rename(columns={'fantasy_points_ppr': f'{team_num}'}, inplace=True)
         teams = teams.merge(team_weekly, on='week', how='left')
@@ -60,29 +33,80 @@ def sim_season(rosters, weekly,season=2024):
 # positions is tuple of two positions to compare
 def pos_variance(top_players,positions):
     p_1,p_2 = positions
-    top_players = top_players[['player_id','season','week','fantasy_points_ppr','position','recent_team']]
+    top_players = top_players[[player_key(top_players),'season','week','fantasy_points_ppr','position','recent_team']]
     top_players = top_players[top_players.position.isin(positions)]
     variances = []
     for season in range(2002,2025):
         season_data = top_players[top_players.season == season].reset_index(drop=True)
-        season_data = season_data.pivot_table(index=['recent_team','week'],columns='position',values='fantasy_points_ppr')
+        season_data = season_data.pivot_table(index=['recent_team','week'],columns='position',values='fantasy_points_ppr',observed=True)
         v = (season_data
-             .groupby(['recent_team'])
+             .groupby(['recent_team'], observed=True)
              .apply(lambda x: x[p_1].corr(x[p_2]))
              .agg('mean'))
         variances.append(v)
     # average of averages is okay b/c NFL has 32 teams every year
     return np.mean(np.array(variances))
 
+SLOTS = ['QB1','RB1','RB2','WR1','WR2','TE1']
+# bump whenever the logic of slot_correlations changes, it is part of the cache key
+CORRELATIONS_VERSION = 2
+
+# Team-level weekly correlation between every pair of depth chart slots in one pass
+# Builds a (season, team, week, slot) array with NaN for missing weeks and computes every
+# pairwise-complete Pearson correlation from centered sums, like Series.corr per team.
+# Rows without a team are left out, as pivot_table does in pos_variance.
+# Returns the 6x6 season-averaged matrix, per-season averages and per-team values. Results are
+# cached on disk keyed by seasons and a hash of the rows they came from.
+def slot_correlations(top_players, seasons=range(2002,2025)):
+    seasons = tuple(seasons)
+    top_players = top_players[['season','recent_team','week','position','fantasy_points_ppr']]
+    top_players = top_players[top_players.season.isin(seasons) & top_players.position.isin(SLOTS)].dropna(subset=['week','recent_team'])
+    rows = int(pd.util.hash_pandas_object(top_players, index=False).sum())
+    key = hashlib.sha256(repr((CORRELATIONS_VERSION, seasons, rows)).encode()).hexdigest()[:32]
+    return cached('slot_correlations', key, lambda: _slot_correlations(top_players, seasons))
+
+def _slot_correlations(top_players, seasons):
+    team_names = top_players['recent_team'].astype(object)
+    teams = np.sort(team_names.unique())
+    s = pd.Index(seasons).get_indexer(top_players['season'])
+    t = np.searchsorted(teams, team_names)
+    w = top_players['week'].to_numpy().astype(int) - 1
+    p = pd.Index(SLOTS).get_indexer(top_players['position'])
+    shape = (len(seasons), len(teams), int(w.max(initial=0)) + 1, len(SLOTS))
+    # average duplicate rows like pivot_table does
+    total = np.zeros(shape)
+    count = np.zeros(shape)
+    np.add.at(total, (s, t, w, p), top_players['fantasy_points_ppr'].fillna(0).to_numpy())
+    np.add.at(count, (s, t, w, p), top_players['fantasy_points_ppr'].notna().to_numpy())
+    present = count > 0
+    x = np.where(present, total / np.maximum(count, 1), 0)
+    m = present.astype(float)
+    # sums over the weeks where both slots have a value
+    n = np.einsum('stwi,stwj->stij', m, m)
+    sx = np.einsum('stwi,stwj->stij', x, m)
+    sxx = np.einsum('stwi,stwj->stij', x**2, m)
+    sxy = np.einsum('stwi,stwj->stij', x, x)
+    sy, syy = sx.swapaxes(-1, -2), sxx.swapaxes(-1, -2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / n
+        var = (sxx - sx**2 / n) * (syy - sy**2 / n)
+        corr = np.where((n > 1) & (var > 0), cov / np.sqrt(var), np.nan)
+    corr = np.clip(corr, -1, 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        by_season = np.nanmean(corr, axis=1)
+        # average of averages is okay b/c NFL has 32 teams every year
+        matrix = np.nanmean(by_season, axis=0)
+    idx = pd.MultiIndex.from_product([seasons, teams, SLOTS, SLOTS], names=['season','recent_team','slot_1','slot_2'])
+    per_team = pd.Series(corr.ravel(), index=idx, name='corr').dropna().reset_index()
+    idx = pd.MultiIndex.from_product([seasons, SLOTS, SLOTS], names=['season','slot_1','slot_2'])
+    per_season = pd.Series(by_season.ravel(), index=idx, name='corr').reset_index()
+    return pd.DataFrame(matrix, index=SLOTS, columns=SLOTS), per_season, per_team
+
 def main():
-    identity, weekly, yearly, overall = load_data()
-    top_players = groups(yearly,weekly,identity,overall)
-    pos = ['QB1','TE1','RB1','RB2','WR1','WR2']
-    pos_combinations = itertools.combinations(pos,2)
-    
-    for c in pos_combinations:
-        print(c)
-        print(pos_variance(top_players,(c[0],c[1])))
+    top_players = top_player_table()
+    matrix, per_season, per_team = slot_correlations(top_players)
+    print(matrix)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
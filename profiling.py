@@ -0,0 +1,112 @@
+# Per-stage wall time, call count and peak memory instrumentation
+# Wrap a function with @profiled() or a block with `with stage(name):`. Nothing is recorded
+# unless profiling is switched on with FF_PROFILE=1, the --profile command line flag or enable(),
+# and when it is off a decorated call costs a single flag check. Peak memory is the most memory
+# Python allocated above what was in use when the stage started, traced with tracemalloc.
+# A summary table is printed when the process exits, and with FF_PROFILE_TRACE=<path> every
+# stage call is also written as a Chrome trace (chrome://tracing or ui.perfetto.dev).
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+_enabled = False
+_trace_path = None
+# name -> {'calls', 'seconds', 'peak'}
+_stats = {}
+# one {'name', 'ts', 'dur', 'tid'} event per finished stage call, for the trace file
+_events = []
+# running peak of every stage open in this thread, innermost last
+_local = threading.local()
+_start = time.perf_counter()
+
+def enabled():
+    return _enabled
+
+def enable(trace=None):
+    global _enabled, _trace_path
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _trace_path = trace or _trace_path
+    if not _enabled:
+        atexit.register(report)
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reset():
+    _stats.clear()
+    _events.clear()
+
+@contextlib.contextmanager
+def stage(name):
+    if not _enabled:
+        yield
+        return
+    # the tracemalloc peak is global, so fold it into the enclosing stage before resetting it
+    running = _local.__dict__.setdefault('open', [])
+    current, peak = tracemalloc.get_traced_memory()
+    if running:
+        running[-1] = max(running[-1], peak)
+    tracemalloc.reset_peak()
+    running.append(current)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        peak = max(running.pop(), tracemalloc.get_traced_memory()[1])
+        if running:
+            running[-1] = max(running[-1], peak)
+        record = _stats.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak': 0})
+        record['calls'] += 1
+        record['seconds'] += seconds
+        record['peak'] = max(record['peak'], peak - current)
+        _events.append({'name': name, 'ts': start - _start, 'dur': seconds, 'tid': threading.get_ident()})
+
+# decorator version of stage, named after the function unless a name is given
+def profiled(name=None):
+    def decorator(func):
+        label = name or f'{func.__module__}.{func.__qualname__}'
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with stage(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# stats per stage, slowest first
+def summary():
+    rows = sorted(_stats.items(), key=lambda item: item[1]['seconds'], reverse=True)
+    return [{'stage': name, **record} for name, record in rows]
+
+def write_trace(path):
+    pid = os.getpid()
+    events = [{'name': e['name'], 'ph': 'X', 'pid': pid, 'tid': e['tid'],
+               'ts': e['ts'] * 1e6, 'dur': e['dur'] * 1e6} for e in _events]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'summary': summary()}, f, indent=1)
+
+def report(file=sys.stderr):
+    rows = summary()
+    if not rows:
+        return
+    print(f"{'stage':<48} {'calls':>7} {'seconds':>10} {'per call':>10} {'peak MB':>9}", file=file)
+    for r in rows:
+        print(f"{r['stage']:<48} {r['calls']:>7} {r['seconds']:>10.3f} {r['seconds'] / r['calls']:>10.4f} {r['peak'] / 2**20:>9.1f}", file=file)
+    if _trace_path:
+        write_trace(_trace_path)
+
+if os.environ.get('FF_PROFILE') or '--profile' in sys.argv:
+    enable(os.environ.get('FF_PROFILE_TRACE'))
@@ -0,0 +1,60 @@
+# Replacement level and points above replacement (PAR)
+# ppg is ranked once per (season, position) in a Leaderboard, so the replacement player for any
+# roster depth is a lookup into that ranking and many league configurations can be evaluated in one pass.
+import numpy as np
+import pandas as pd
+from assumptions import last_pos, TEAMS, team_composition
+from leaderboard import Leaderboard
+
+REPLACEMENT_POSITIONS = ['QB', 'RB', 'WR', 'TE', 'K']
+
+# rank of the replacement player per position for a league configuration
+def replacement_depths(teams=TEAMS, composition=team_composition):
+    return {pos: int(last_pos(pos, teams, composition)) for pos in REPLACEMENT_POSITIONS}
+
+# Replacement ppg per (config, season, position) for a list of league configurations
+# Each config is a dict with optional 'teams' and 'composition' keys, e.g.
+# {'teams': 12, 'composition': {**team_composition, 'SFLEX': 1}}
+# The replacement player is the depth-th best ppg of the group, or 0 if there are not enough players.
+# board is an optional Leaderboard of ppg by (season, position) over data, e.g. the shared
+# derived.leaderboard('players', 'ppg', ('season', 'position')); it is built here otherwise.
+def replacement_table(data, configs, board=None):
+    if board is None:
+        board = Leaderboard(data, 'ppg', ['season', 'position'])
+    # groups of the positions that have a replacement level, players without ppg are not counted
+    groups = np.flatnonzero(board.keys['position'].isin(REPLACEMENT_POSITIONS).to_numpy())
+    keys = board.keys.iloc[groups].reset_index(drop=True)
+    # (configs, groups) depth of the replacement player
+    depths = np.array([[replacement_depths(c.get('teams', TEAMS), c.get('composition', team_composition))[pos]
+                        for pos in keys['position']] for c in configs]).reshape(len(configs), len(keys))
+    values = board.kth(depths, groups=groups, default=0)
+    table = pd.concat([keys] * len(configs), ignore_index=True)
+    table.insert(0, 'config', np.repeat(np.arange(len(configs)), len(keys)))
+    table['ppg'] = values.ravel()
+    return table
+
+# find stats for replacement player
+def replacement_stats(data, teams=TEAMS, composition=team_composition, board=None):
+    table = replacement_table(data, [{'teams': teams, 'composition': composition}], board)
+    return table.drop(columns='config')
+
+# player_id, and player_code for tables from the store
+def player_columns(data):
+    return [col for col in ['player_id', 'player_code'] if col in data.columns]
+
+# calculate points above replacement for each player
+def par(data, replacement):
+    data = data.merge(replacement, on=['season', 'position'], how='left', suffixes=('', '_replacement'))
+    data['par'] = data['ppg'] - data['ppg_replacement']
+    data = data.drop(columns=['ppg_replacement']) 
+    data = Leaderboard(data, 'par', ['season']).table(ascending=False)
+    return data[player_columns(data) + ['player_name','season', 'position', 'ppg', 'par']].reset_index(drop=True)
+
+# PAR tables for many league configurations in one pass, with a config column indexing configs
+def par_sweep(data, configs, board=None):
+    replacement = replacement_table(data, configs, board)
+    data = data.merge(replacement, on=['season', 'position'], how='left', suffixes=('', '_replacement'))
+    data['par'] = data['ppg'] - data['ppg_replacement']
+    return (data[['config'] + player_columns(data) + ['player_name', 'season', 'position', 'ppg', 'par']]
+        .sort_values(by=['config', 'season', 'par'], ascending=[True, False, False])
+        .reset_index(drop=True))
@@ -0,0 +1,156 @@
+# Dense (season, week, player) tensor of weekly fantasy points
+# Players are mapped to integer slots once so team scores become a gather-and-sum instead of
+# filtering the weekly table for every roster. Weeks a player did not play are stored as 0.
+# Players are keyed by player_code when weekly has it (see data_store.player_key), and codes are
+# looked up in a dense code -> slot array.
+import hashlib
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from data_store import player_key
+
+
+class ScoreTensor:
+    def __init__(self, weekly, column='fantasy_points_ppr'):
+        self.key = player_key(weekly)
+        weekly = weekly[[self.key, 'season', 'week', column]].dropna(subset=[self.key])
+        if self.key == 'player_code':
+            # ids missing from the registry are interned as -1
+            weekly = weekly[weekly[self.key] >= 0]
+        # slot -> player key, plus one trailing empty slot that always scores 0
+        self._set_players(np.sort(weekly[self.key].unique()))
+        self.seasons = np.sort(weekly['season'].unique())
+        self.weeks = {s: np.sort(w.unique()) for s, w in weekly.groupby('season')['week']}
+        max_week = int(weekly['week'].max())
+        season_idx = np.searchsorted(self.seasons, weekly['season'].to_numpy())
+        week_idx = weekly['week'].to_numpy().astype(np.int64) - 1
+        slot = self.slots(weekly[self.key])
+        self.points = np.zeros((len(self.seasons), max_week, self.empty + 1))
+        np.add.at(self.points, (season_idx, week_idx, slot), weekly[column].fillna(0).to_numpy())
+        # weeks a player has a row in weekly, even with 0 points
+        self.appeared = np.zeros(self.points.shape, dtype=bool)
+        self.appeared[season_idx, week_idx, slot] = True
+        self._covariance = {}
+
+    # write the arrays to a directory so other processes can memory-map them with load
+    # The arrays go to a temporary directory that is renamed into place, so path either does not
+    # exist or holds a complete tensor, even when a save is interrupted.
+    def save(self, path):
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        played = np.zeros(self.points.shape[:2], dtype=bool)
+        for i, season in enumerate(self.seasons):
+            played[i, self.weeks[season] - 1] = True
+        np.save(os.path.join(tmp, 'points.npy'), self.points)
+        np.save(os.path.join(tmp, 'players.npy'), self.players if self.key == 'player_code' else self.players.astype(str))
+        np.save(os.path.join(tmp, 'seasons.npy'), self.seasons)
+        np.save(os.path.join(tmp, 'played.npy'), played)
+        np.save(os.path.join(tmp, 'appeared.npy'), self.appeared)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        tensor = cls.__new__(cls)
+        tensor.points = np.load(os.path.join(path, 'points.npy'), mmap_mode=mmap_mode)
+        tensor.appeared = np.load(os.path.join(path, 'appeared.npy'), mmap_mode=mmap_mode)
+        players = np.load(os.path.join(path, 'players.npy'))
+        tensor.key = 'player_id' if players.dtype.kind == 'U' else 'player_code'
+        tensor._set_players(players.astype(object) if tensor.key == 'player_id' else players)
+        tensor.seasons = np.load(os.path.join(path, 'seasons.npy'))
+        played = np.load(os.path.join(path, 'played.npy'))
+        tensor.weeks = {s: np.flatnonzero(row) + 1 for s, row in zip(tensor.seasons, played)}
+        tensor._covariance = {}
+        return tensor
+
+    def _set_players(self, players):
+        self.players = players
+        self.index = pd.Index(players)
+        self.empty = len(players)
+        self._lookup = None
+        if self.key == 'player_code':
+            self._lookup = np.full(int(players.max(initial=-1)) + 1, self.empty, dtype=np.int64)
+            self._lookup[players] = np.arange(len(players))
+
+    # player keys -> slots, unknown players go to the empty slot
+    def slots(self, player_ids):
+        if self._lookup is not None:
+            codes = np.asarray(player_ids)
+            if codes.dtype.kind in 'iu':
+                slots = np.full(codes.shape, self.empty, dtype=np.int64)
+                known = (codes >= 0) & (codes < len(self._lookup))
+                slots[known] = self._lookup[codes[known]]
+                return slots
+        slots = self.index.get_indexer(pd.Index(player_ids))
+        slots[slots < 0] = self.empty
+        return slots
+
+    # list of rosters -> (teams, roster size) slot array padded with the empty slot
+    def roster_slots(self, rosters):
+        size = max([len(team) for team in rosters] + [1])
+        slots = np.full((len(rosters), size), self.empty)
+        for i, team in enumerate(rosters):
+            slots[i, :len(team)] = self.slots(list(team))
+        return slots
+
+    # season(s) -> position along the first axis of points
+    def season_index(self, seasons):
+        s = np.searchsorted(self.seasons, seasons)
+        missing = (s == len(self.seasons)) | (self.seasons[np.minimum(s, len(self.seasons) - 1)] != seasons)
+        if np.any(missing):
+            raise KeyError(f'No weekly data for season {np.asarray(seasons)[missing].tolist()}')
+        return s
+
+    # weeks x players matrix for one season, only weeks that were played
+    def season(self, season):
+        return self.points[self.season_index(season), self.weeks[season] - 1]
+
+    # weeks x players mask of who has a weekly row, matching season
+    def season_appeared(self, season):
+        return self.appeared[self.season_index(season), self.weeks[season] - 1]
+
+    # Covariance of weekly points between the players who scored in a season, cached per season
+    # Returns (pool, cov) where pool maps every slot to a row of cov; the last row is all zeros
+    # and is shared by every player who never scored, the empty slot included.
+    def covariance(self, season):
+        if season not in self._covariance:
+            matrix = self.season(season)
+            scored = np.flatnonzero(matrix.any(axis=0))
+            pool = np.full(self.empty + 1, len(scored))
+            pool[scored] = np.arange(len(scored))
+            cov = np.zeros((len(scored) + 1, len(scored) + 1))
+            cov[:-1, :-1] = np.atleast_2d(np.cov(matrix[:, scored], rowvar=False))
+            self._covariance[season] = (pool, cov)
+        return self._covariance[season]
+
+    # use a (pool, cov) pair computed elsewhere, e.g. OnlineStats.covariance(season, tensor)
+    def set_covariance(self, season, pool, cov):
+        self._covariance[season] = (pool, cov)
+
+    # weeks x teams matrix of team scores
+    def team_scores(self, rosters, season):
+        if not isinstance(rosters, np.ndarray):
+            rosters = self.roster_slots(rosters)
+        return self.season(season)[:, rosters].sum(axis=2)
+
+    # same layout as sim_season: one column per team indexed by week
+    def season_frame(self, rosters, season):
+        scores = self.team_scores(rosters, season)
+        teams = pd.DataFrame(scores, columns=[f'{i}' for i in range(scores.shape[1])])
+        teams.index = pd.Index(self.weeks[season], name='week')
+        return teams
+
+# hash of the weekly rows a tensor is built from, so a saved tensor can be tied to its data
+def weekly_hash(weekly, column='fantasy_points_ppr'):
+    rows = weekly[[player_key(weekly), 'season', 'week', column]]
+    return hashlib.sha256(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()[:16]
+
+# Directory under root holding the saved tensor of weekly, named by weekly_hash
+# The tensor is built and saved only when no complete one for the same rows exists yet.
+def saved_tensor(root, weekly):
+    path = os.path.join(root, f'tensor-{weekly_hash(weekly)}')
+    if not os.path.isdir(path):
+        ScoreTensor(weekly).save(path)
+    return path
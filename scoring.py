@@ -0,0 +1,77 @@
+# Score weekly stats under many fantasy scoring systems at once
+# A rule set is a dict of points per unit of each stat in STATS. Rule sets are stacked into a
+# (stats, rule sets) matrix so scoring every player-week under all of them is one matrix
+# multiply of the (player-weeks, stats) component matrix with the rules.
+import numpy as np
+import pandas as pd
+from data_store import player_key
+
+# weekly_stats columns that can be scored, plus te_receptions for tight end premium leagues
+STATS = ['passing_yards', 'passing_tds', 'interceptions', 'rushing_yards', 'rushing_tds',
+         'receptions', 'te_receptions', 'receiving_yards', 'receiving_tds', 'fumbles', '2pt']
+
+PPR = {
+    'passing_yards': 0.04,
+    'passing_tds': 4,
+    'interceptions': -2,
+    'rushing_yards': 0.1,
+    'rushing_tds': 6,
+    'receptions': 1,
+    'receiving_yards': 0.1,
+    'receiving_tds': 6,
+    'fumbles': -2,
+    '2pt': 2
+}
+
+# default rule sets, all of them scored from weekly alone
+SCORING = {
+    'ppr': PPR,
+    'half_ppr': {**PPR, 'receptions': 0.5},
+    'standard': {**PPR, 'receptions': 0},
+    'six_pt_pass_td': {**PPR, 'passing_tds': 6}
+}
+
+# opt-in, it needs identity: score(weekly, {**SCORING, 'te_premium': TE_PREMIUM}, identity)
+TE_PREMIUM = {**PPR, 'te_receptions': 0.5}
+
+# (stats, rule sets) frame of points per unit, stats a rule set leaves out score 0
+def rule_matrix(rules=SCORING):
+    unknown = {stat for rule in rules.values() for stat in rule} - set(STATS)
+    if unknown:
+        raise ValueError(f'Unknown scoring stats {sorted(unknown)}')
+    return pd.DataFrame(rules, index=STATS, dtype=float).fillna(0)
+
+# (player-weeks, stats) component matrix of weekly, missing stats count as 0
+# identity supplies positions for te_receptions, without it no receptions count as TE receptions
+def stat_matrix(weekly, identity=None):
+    components = np.zeros((len(weekly), len(STATS)))
+    for i, stat in enumerate(STATS):
+        if stat in weekly.columns:
+            components[:, i] = weekly[stat].fillna(0).to_numpy(dtype=float)
+    if identity is not None:
+        key = player_key(weekly)
+        positions = identity.drop_duplicates(key).set_index(key)['position']
+        te = (weekly[key].map(positions) == 'TE').to_numpy()
+        components[:, STATS.index('te_receptions')] = components[:, STATS.index('receptions')] * te
+    return components
+
+# Points for every row of weekly under every rule set, one column per rule set
+# Rules that score te_receptions need identity, unless weekly has a te_receptions column.
+def score(weekly, rules=SCORING, identity=None):
+    matrix = rule_matrix(rules)
+    te_rules = matrix.columns[matrix.loc['te_receptions'] != 0].tolist()
+    if te_rules and identity is None and 'te_receptions' not in weekly.columns:
+        raise ValueError(f'Rule sets {te_rules} score te_receptions, which needs identity for player positions')
+    points = stat_matrix(weekly, identity) @ matrix.to_numpy()
+    return pd.DataFrame(points.round(2), index=weekly.index, columns=matrix.columns)
+
+# weekly with a points column per rule set added, ready for ScoreTensor(weekly, column=name)
+def rescore(weekly, rules=SCORING, identity=None):
+    return pd.concat([weekly.drop(columns=list(rules), errors='ignore'), score(weekly, rules, identity)], axis=1)
+
+# Season totals per player under every rule set, one column per rule set
+def season_points(weekly, rules=SCORING, identity=None):
+    points = score(weekly, rules, identity)
+    key = player_key(weekly)
+    keys = [weekly[key].to_numpy(), weekly['season'].to_numpy()]
+    return points.groupby(keys).sum().rename_axis([key, 'season']).reset_index()
@@ -0,0 +1,108 @@
+# Synthetic weekly score matrices for a drafted player pool
+# History has one season per year, so draft strategies only ever see a handful of outcomes. These
+# generators draw as many synthetic seasons as needed for a pool of tensor slots, as
+# (seasons, weeks, players) arrays that stand in for tensor.season(season)[:, slots].
+#   block_bootstrap: blocks of consecutive historical weeks, the same weeks for every player so
+#     streaks and player-to-player dependence are kept
+#   parametric: multivariate normal around each player's mean and standard deviation, correlated
+#     within an NFL team by the depth chart slot correlations of slot_correlations
+import numpy as np
+import pandas as pd
+from batch_sim import all_play_wins
+from positional_covariance import SLOTS
+
+# Week indices (n_seasons, weeks) into the stacked weeks of seasons, drawn in blocks
+# Blocks never run across the end of a season.
+def bootstrap_weeks(tensor, seasons, n_seasons, weeks=None, block=4, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    seasons = np.atleast_1d(seasons)
+    lengths = np.array([len(tensor.weeks[s]) for s in seasons])
+    weeks = weeks if weeks is not None else int(lengths[0])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    starts = np.concatenate([o + np.arange(n - block + 1) for o, n in zip(offsets, lengths)])
+    if len(starts) == 0:
+        raise ValueError(f'Blocks of {block} weeks do not fit in seasons {seasons.tolist()}')
+    n_blocks = -(-weeks // block)
+    first = starts[rng.integers(0, len(starts), size=(n_seasons, n_blocks))]
+    return (first[..., None] + np.arange(block)).reshape(n_seasons, -1)[:, :weeks]
+
+# (n_seasons, weeks, players) moving block bootstrap of the slots' weekly points in seasons
+# Players score 0 in seasons they did not play, so resample from the seasons the pool comes from.
+def block_bootstrap(tensor, slots, seasons, n_seasons, weeks=None, block=4, rng=None):
+    seasons = np.atleast_1d(seasons)
+    stacked = np.concatenate([tensor.season(s)[:, slots] for s in seasons])
+    return stacked[bootstrap_weeks(tensor, seasons, n_seasons, weeks, block, rng)]
+
+# Mean and standard deviation of weekly points over the weeks each slot played, plus the NFL team
+# and depth chart slot (QB1, RB1, ...) of every player from top_player_table rows of the season
+# Players outside the depth chart slots get '' and are drawn independently.
+def pool_parameters(tensor, slots, season, top_players):
+    points = tensor.season(season)[:, slots]
+    appeared = tensor.season_appeared(season)[:, slots]
+    n = appeared.sum(axis=0)
+    means = np.where(n > 0, (points * appeared).sum(axis=0) / np.maximum(n, 1), 0)
+    squares = (appeared * (points - means) ** 2).sum(axis=0)
+    sds = np.where(n > 1, np.sqrt(squares / np.maximum(n - 1, 1)), 0)
+    depth = (top_players[(top_players['season'] == season) & top_players['position'].isin(SLOTS)]
+             .drop_duplicates(tensor.key)
+             .set_index(tensor.key)[['recent_team', 'position']]
+             .astype(object))
+    # the empty slot past the last player gets ''
+    depth = depth.reindex(tensor.players).fillna('')
+    teams = np.append(depth['recent_team'].to_numpy(dtype=str), '')[slots]
+    return means, sds, teams, np.append(depth['position'].to_numpy(dtype=str), '')[slots]
+
+# players x players correlation: slot correlations between teammates, 0 across teams
+def pool_correlation(corr, teams, depth):
+    corr = pd.DataFrame(corr).reindex(index=SLOTS, columns=SLOTS).fillna(0).to_numpy()
+    slot = pd.Index(SLOTS).get_indexer(depth)
+    known = slot >= 0
+    same = (teams[:, None] == teams[None, :]) & (teams[:, None] != '') & known[:, None] & known[None, :]
+    matrix = np.where(same, corr[slot[:, None], slot[None, :]], 0)
+    np.fill_diagonal(matrix, 1)
+    return matrix
+
+# Cholesky factor of a correlation matrix, negative eigenvalues of the averaged slot
+# correlations are clipped so it is always positive definite
+def _factor(matrix):
+    values, vectors = np.linalg.eigh(matrix)
+    repaired = (vectors * np.maximum(values, 1e-9)) @ vectors.T
+    scale = np.sqrt(np.diag(repaired))
+    return np.linalg.cholesky(repaired / np.outer(scale, scale))
+
+# (n_seasons, weeks, players) multivariate normal weekly points
+# corr is the 6x6 matrix of slot_correlations. Teammates are only correlated with each other, so
+# the factor is block diagonal with one small Cholesky block per NFL team and only the players in
+# a depth chart slot need to be mixed.
+# floor clips the draws from below, e.g. 0 or the worst historical week.
+def parametric(means, sds, teams, depth, corr, n_seasons, weeks=17, rng=None, floor=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    teams, depth = np.asarray(teams), np.asarray(depth)
+    matrix = pool_correlation(corr, teams, depth)
+    known = np.flatnonzero((teams != '') & (pd.Index(SLOTS).get_indexer(depth) >= 0))
+    factor = np.zeros((len(known), len(known)))
+    for team in np.unique(teams[known]):
+        block = np.flatnonzero(teams[known] == team)
+        factor[np.ix_(block, block)] = _factor(matrix[np.ix_(known[block], known[block])])
+    draws = rng.standard_normal((n_seasons, weeks, len(means)))
+    draws[..., known] = draws[..., known] @ factor.T
+    draws *= np.asarray(sds)
+    draws += np.asarray(means)
+    return draws if floor is None else np.maximum(draws, floor, out=draws)
+
+# Score drafts on synthetic seasons
+# samples is (n_seasons, weeks, players) from either generator and picks (teams, rounds) or
+# (n_seasons, teams, rounds) indices into its players, e.g. tensor slots mapped to pool positions.
+# Returns weekly scores (n_seasons, weeks, teams), total points, variance and all-play wins like
+# simulate_leagues.
+def synthetic_leagues(samples, picks):
+    picks = np.broadcast_to(picks, samples.shape[:1] + np.shape(picks)[-2:])
+    leagues = np.arange(len(samples))[:, None, None, None]
+    weeks = np.arange(samples.shape[1])[None, :, None, None]
+    weekly = samples[leagues, weeks, picks[:, None]].sum(axis=3)
+    return {
+        'weekly': weekly,
+        'points': weekly.sum(axis=1),
+        'variance': weekly.var(axis=1, ddof=1),
+        'wins': all_play_wins(weekly)
+    }
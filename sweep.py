@@ -0,0 +1,202 @@
+# Parameter sweeps of draft + season experiments over noise, league size, roster shape and seasons
+# A grid is the cross product of its settings and every cell runs its own trials, like a
+# monte_carlo run. Everything the cells share is done once up front: one score tensor over all
+# seasons of the grid, saved and memory-mapped by every worker, one par_sweep over all (teams,
+# composition) configurations and the lineup position codes. Cells are cut into chunks that run
+# on a process pool, chunk i of cell c always draws from the same child of SeedSequence(seed), and
+# every chunk is written to its own file, so a sweep is reproducible for any number of workers
+# and resumes where it stopped.
+#   grid = {
+#       'noise': [2, 4, 8],
+#       'teams': [8, 10, 12],
+#       'composition': {'standard': team_composition, 'superflex': {**team_composition, 'SFLEX': 1}},
+#       'seasons': {'recent': [2022, 2023, 2024]},
+#       'trials': 10000
+#   }
+import glob
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from assumptions import TEAMS, team_composition, flex_positions
+from batch_sim import simulate_leagues
+from data_store import load_table, player_key
+from derived import players as player_table
+from draft_engine import DRAFT_POSITIONS, noisy_drafts
+from lineup import roster_limits, slot_positions
+from replacement import par_sweep
+from score_matrix import ScoreTensor, saved_tensor, weekly_hash
+
+CHUNK = 1000
+# settings that describe a cell, in results table order
+SETTINGS = ['noise', 'teams', 'composition', 'seasons']
+
+# per-process state set up once by _init_worker
+_state = {}
+
+def _init_worker(tensor_dir, par_data, positions):
+    _state['tensor'] = ScoreTensor.load(tensor_dir)
+    _state['par'] = par_data
+    _state['positions'] = positions
+
+# Cells of a grid, one dict per combination of settings
+# composition and seasons are dicts of name -> value so the results can refer to them by name;
+# a single composition dict or season list is named 'default'.
+def grid_cells(grid):
+    compositions = grid.get('composition', {'default': team_composition})
+    if 'QB' in compositions:
+        compositions = {'default': compositions}
+    season_sets = grid.get('seasons', {'default': [2024]})
+    if not isinstance(season_sets, dict):
+        season_sets = {'default': list(season_sets)}
+    cells = []
+    for noise, teams, composition, seasons in itertools.product(
+            grid.get('noise', [4]), grid.get('teams', [TEAMS]), compositions, season_sets):
+        cells.append({'noise': float(noise), 'teams': int(teams), 'composition': composition,
+                      'roster': compositions[composition], 'seasons': [int(s) for s in season_sets[seasons]],
+                      'season_set': seasons, 'trials': int(grid.get('trials', CHUNK))})
+    return cells
+
+# a roster with FLEX or SFLEX slots only differs from its fixed positions once lineups are set
+def has_flex(composition):
+    return any(composition.get(slot, 0) for slot in flex_positions)
+
+def chunk_path(out_dir, cell, index):
+    return os.path.join(out_dir, f'cell_{cell:04d}_chunk_{index:06d}.npz')
+
+# run one chunk of trials of a cell and write it to disk
+def run_chunk(cell, index, trials, seed_seq, out_dir, settings):
+    tensor, positions = _state['tensor'], _state['positions']
+    par_data = _state['par'][settings['config']]
+    rng = np.random.default_rng(seed_seq)
+    composition = settings['roster']
+    if not settings['lineups']:
+        positions = None
+    draft_composition = roster_limits(composition) if positions is not None else composition
+    seasons = rng.choice(settings['seasons'], size=trials)
+    slots = np.zeros((trials, settings['teams'], 0), dtype=np.int64)
+    for season in np.unique(seasons):
+        trial = np.flatnonzero(seasons == season)
+        drafts = noisy_drafts(par_data, settings['teams'], len(trial), season=season, noise=settings['noise'],
+                              rng=rng, composition=draft_composition)
+        if slots.shape[2] == 0:
+            slots = np.zeros((trials,) + drafts.shape[1:], dtype=np.int64)
+        slots[trial] = tensor.slots(drafts.ravel()).reshape(drafts.shape)
+    results = simulate_leagues(tensor, slots, seasons, positions=positions, composition=composition)
+    # write to a temporary file first so a killed run never leaves a partial chunk behind
+    path = chunk_path(out_dir, cell, index)
+    np.savez(path + '.tmp.npz', cell=cell, index=index, season=seasons, points=results['points'],
+             variance=results['variance'], wins=results['wins'])
+    os.replace(path + '.tmp.npz', path)
+    return cell, index
+
+# Run every cell of grid into out_dir and return the results table
+# players is the overall table with identity (derived.players) of every season in the grid and
+# weekly the weekly stats of those seasons. With lineups, teams draft a bench (lineup.roster_limits)
+# and only their best lineup of each week scores, otherwise the whole roster scores as in
+# monte_carlo. lineups=None turns them on for the cells whose composition has FLEX or SFLEX
+# slots, which would otherwise only change PAR. Chunks already on disk are skipped, so calling
+# this again with the same grid resumes.
+def run_sweep(out_dir, players, weekly, grid, seed=0, workers=None, chunk=CHUNK, lineups=None):
+    os.makedirs(out_dir, exist_ok=True)
+    cells = grid_cells(grid)
+    for cell in cells:
+        cell['lineups'] = has_flex(cell['roster']) if lineups is None else bool(lineups)
+    # one PAR configuration per distinct (teams, composition)
+    configs = list(dict.fromkeys((cell['teams'], cell['composition']) for cell in cells))
+    for cell in cells:
+        cell['config'] = configs.index((cell['teams'], cell['composition']))
+    seasons = sorted({s for cell in cells for s in cell['seasons']})
+    weekly = weekly[weekly['season'].isin(seasons)]
+    settings = {'cells': cells, 'seed': seed, 'chunk': chunk, 'lineups': lineups, 'weekly': weekly_hash(weekly)}
+    settings_path = os.path.join(out_dir, 'settings.json')
+    if os.path.exists(settings_path):
+        with open(settings_path) as f:
+            saved = json.load(f)
+        if saved != settings:
+            raise ValueError(f'{out_dir} holds a sweep with different settings')
+    with open(settings_path, 'w') as f:
+        json.dump(settings, f)
+    tensor_dir = saved_tensor(out_dir, weekly)
+    players = players[players['season'].isin(seasons)]
+    compositions = {cell['composition']: cell['roster'] for cell in cells}
+    table = par_sweep(players, [{'teams': teams, 'composition': compositions[name]} for teams, name in configs])
+    table = table[table['position'].isin(DRAFT_POSITIONS)]
+    par_data = {config: data[[player_key(data), 'season', 'position', 'par']].reset_index(drop=True)
+                for config, data in table.groupby('config')}
+    positions = slot_positions(ScoreTensor.load(tensor_dir), players) if any(cell['lineups'] for cell in cells) else None
+    tasks = []
+    for c, child in enumerate(np.random.SeedSequence(seed).spawn(len(cells))):
+        n_chunks = -(-cells[c]['trials'] // chunk)
+        for i, seed_seq in enumerate(child.spawn(n_chunks)):
+            if not os.path.exists(chunk_path(out_dir, c, i)):
+                tasks.append((c, i, min(chunk, cells[c]['trials'] - i * chunk), seed_seq, out_dir, cells[c]))
+    if workers == 1:
+        _init_worker(tensor_dir, par_data, positions)
+        for task in tasks:
+            run_chunk(*task)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(tensor_dir, par_data, positions)) as pool:
+            futures = [pool.submit(run_chunk, *task) for task in tasks]
+            for future in as_completed(futures):
+                future.result()
+    results = load_results(out_dir)
+    results.to_parquet(os.path.join(out_dir, 'results.parquet'), index=False)
+    return results
+
+# One row per (cell, trial, team) from every finished chunk, with the settings of the cell
+def load_results(out_dir):
+    with open(os.path.join(out_dir, 'settings.json')) as f:
+        settings = json.load(f)
+    cells, size = settings['cells'], settings['chunk']
+    frames = []
+    for path in sorted(glob.glob(os.path.join(out_dir, 'cell_*_chunk_*[0-9].npz'))):
+        with np.load(path) as chunk:
+            cell, index = int(chunk['cell']), int(chunk['index'])
+            trials, teams = chunk['points'].shape
+            frames.append(pd.DataFrame({
+                'cell': np.int32(cell),
+                'trial': np.repeat(index * size + np.arange(trials), teams),
+                'season': np.repeat(chunk['season'], teams),
+                'team': np.tile(np.arange(teams), trials),
+                'points': chunk['points'].ravel(),
+                'variance': chunk['variance'].ravel(),
+                'wins': chunk['wins'].ravel()
+            }))
+    if not frames:
+        return pd.DataFrame()
+    results = pd.concat(frames, ignore_index=True)
+    # settings are looked up per cell and stored once per distinct value
+    cell_table = pd.DataFrame(cells)
+    cell_table['seasons'] = cell_table['season_set']
+    for col in SETTINGS:
+        values = cell_table[col].to_numpy()[results['cell'].to_numpy()]
+        results.insert(results.columns.get_loc('trial'), col, values)
+    results['composition'] = results['composition'].astype('category')
+    results['seasons'] = results['seasons'].astype('category')
+    return results
+
+# Mean and standard deviation of points, variance and wins for every setting and draft slot
+def summarize(results):
+    return (results
+        .groupby(SETTINGS + ['team'], observed=True)[['points', 'variance', 'wins']]
+        .agg(['mean', 'std'])
+        .reset_index())
+
+def main():
+    SZN = [2019,2020,2021,2022,2023,2024]
+    grid = {
+        'noise': [2, 4, 8],
+        'teams': [8, 10, 12],
+        'composition': {'standard': team_composition, 'superflex': {**team_composition, 'SFLEX': 1}},
+        'seasons': {'recent': SZN},
+        'trials': 10000
+    }
+    weekly = load_table('weekly', SZN)
+    results = run_sweep('data/sweep', player_table(SZN), weekly, grid, seed=2024)
+    print(summarize(results).groupby(SETTINGS, observed=True)[[('wins', 'mean')]].max())
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,6 @@
 # Interesting but not very useful information
-import pandas as pd
-
-def load_data():
-    # Load the data from CSV files
-    identity = pd.read_csv('data/player_identity.csv')
-    weekly = pd.read_csv('data/weekly_stats.csv')
-    yearly = pd.read_csv('data/yearly_stats.csv')
-    overall = pd.read_csv('data/overall_stats.csv')
-    
-    return identity, weekly, yearly, overall
+from data_store import load_data
+from derived import leaderboard
 
 def main():
     identity, weekly, yearly, overall = load_data()
@@ -16,19 +8,17 @@ def main():
     print(identity.dtypes)
     print(overall.head(10))
     print(identity.head(10))
-    #add identity info for display purposes
-    overall = overall.merge(identity, on='player_id', how='left')
-    overall = overall.sort_values(by=['ppg'],ascending=False)
-    overall = overall.reset_index(drop=True)
-    print(overall[['player_name','season','ppg','std_dev']].head(10))
-
-    overall = overall.sort_values(by=['std_dev'],ascending=False)
-    print(overall[['player_name','season','ppg','std_dev']].head(10))
+    #identity info for display purposes comes with the players table of the shared leaderboards
+    columns = ['player_name','season','ppg','std_dev']
+    print(leaderboard('players', 'ppg').top(10)[columns].reset_index(drop=True))
 
-    overall = overall[overall['ppg'] > 10.0]
-    overall.reset_index(drop=True, inplace=True)
-    print(overall[['player_name','season','ppg','std_dev']].head(25))
+    by_std_dev = leaderboard('players', 'std_dev')
+    print(by_std_dev.top(10)[columns])
 
+    consistent = by_std_dev.table()
+    consistent = consistent[consistent['ppg'] > 10.0]
+    consistent.reset_index(drop=True, inplace=True)
+    print(consistent[columns].head(25))
 
 
 if __name__ == "__main__":